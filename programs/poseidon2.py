@@ -1,231 +1,853 @@
-from math import ceil, log, gcd, floor, comb
+from math import comb
 
-from Compiler.types import sint, cint
+from Compiler.types import sint, cint, regint, MemValue
+from Compiler.program import Program
+from Compiler.library import for_range, runtime_error_if, start_timer, stop_timer, \
+    print_ln
+
+from poseidon2_params import M4, get_alpha, round_numbers, external_m4, \
+    instance_parameters, sponge_permutations, keygen_permutations
+
+def extend_powers(powers, e):
+    """Adds x^e to the dict powers (exponent -> value, containing 1) as a
+    product of two lower powers, keeping the multiplicative depth at
+    ceil(log2(e))"""
+    if e not in powers:
+        a = 1 << ((e - 1).bit_length() - 1)
+        extend_powers(powers, a)
+        extend_powers(powers, e - a)
+        powers[e] = powers[a] * powers[e - a]
+    return powers[e]
+
+def power_multiplications(known, exponents):
+    """Number of products extend_powers needs for the exponents, starting
+    from the known ones"""
+    powers = dict.fromkeys(known, 1)
+    for e in exponents:
+        extend_powers(powers, e)
+    return len(powers) - len(known)
+
+def pair_monomials(alpha):
+    """Exponents (m, k) of the monomials r^m r'^k besides 1 that a pair of
+    partial rounds expands into: m <= alpha * (alpha - k) for k <= alpha"""
+    return [(m, k) for k in range(alpha + 1) for m in range(alpha * (alpha - k) + 1)
+            if m or k]
+
+def pair_multiplications(alpha):
+    """Number of products random_pair_monomials needs"""
+    cross = sum(alpha * (alpha - k) for k in range(1, alpha + 1))
+    return power_multiplications((1, 2), range(1, alpha**2 + 1)) + \
+        power_multiplications((1, 2), range(1, alpha + 1)) + cross
+
+def random_pair_monomials(n, alpha):
+    """Returns {(m, k): r^m r'^k} for n pairs of random values r, r'. The
+    powers of r and r' come from random squares, the mixed monomials are
+    one product of two powers each."""
+    r, r2 = sint.get_random_square(size=n)
+    s, s2 = sint.get_random_square(size=n)
+    r_powers, s_powers = {1: r, 2: r2}, {1: s, 2: s2}
+    exponents = pair_monomials(alpha)
+    monomials = {}
+    for m, k in exponents:
+        if not k:
+            monomials[(m, k)] = extend_powers(r_powers, m)
+        elif not m:
+            monomials[(m, k)] = extend_powers(s_powers, k)
+    for m, k in exponents:
+        if m and k:
+            monomials[(m, k)] = r_powers[m] * s_powers[k]
+    return monomials
+
+def poly_mul(a, b):
+    """Product of two polynomials given as coefficient lists"""
+    res = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            res[i + j] = res[i + j] + x * y
+    return res
+
+class PowerTuples:
+    """Pool of (r, r^2, ..., r^degree) tuples generated in bulk ahead of the
+    online phase. Tuples are handed out in order through a runtime counter,
+    so the pool can also be consumed from runtime loops."""
+    batch_size = 2**16
+
+    def __init__(self, size, degree):
+        self.size = size
+        self.degree = degree
+        self.powers = sint.Matrix(degree, size)
+        self.used = MemValue(regint(0))
+
+    def generate(self):
+        for base in range(0, self.size, self.batch_size):
+            n = min(self.batch_size, self.size - base)
+            r, r2 = sint.get_random_square(size=n)
+            powers = {1: r, 2: r2}
+            for e in range(1, self.degree + 1):
+                self.powers[e - 1].assign_vector(extend_powers(powers, e), base)
+        self.used.write(0)
+
+    def take(self, n):
+        """Returns [r, r^2, ..., r^degree] as vectors of size n"""
+        base = self.used.read()
+        runtime_error_if(base + n > self.size, 'power tuple pool exhausted')
+        self.used.write(base + n)
+        return [self.powers[e].get_vector(base, n) for e in range(self.degree)]
+
+class PairTuples:
+    """Pool of the monomials of random_pair_monomials for paired partial
+    rounds, generated in bulk and handed out like PowerTuples"""
+    batch_size = 2**14
+
+    def __init__(self, size, alpha):
+        self.size = size
+        self.alpha = alpha
+        self.exponents = pair_monomials(alpha)
+        self.monomials = sint.Matrix(len(self.exponents), size)
+        self.used = MemValue(regint(0))
+
+    def generate(self):
+        for base in range(0, self.size, self.batch_size):
+            n = min(self.batch_size, self.size - base)
+            monomials = random_pair_monomials(n, self.alpha)
+            for i, exponent in enumerate(self.exponents):
+                self.monomials[i].assign_vector(monomials[exponent], base)
+        self.used.write(0)
+
+    def take(self, n):
+        """Returns {(m, k): r^m r'^k} as vectors of size n"""
+        base = self.used.read()
+        runtime_error_if(base + n > self.size, 'pair monomial pool exhausted')
+        self.used.write(base + n)
+        return {exponent: self.monomials[i].get_vector(base, n)
+                for i, exponent in enumerate(self.exponents)}
 
 class Poseidon2:
-    def __init__(self, p, t, Me, Mi, round_constants):
-        self.alpha = Poseidon2.get_alpha(p)
+    # S-box evaluation strategies:
+    # masked: opens x - r once and expands (x - r + r)^alpha with preprocessed
+    #         powers of r, one round for any alpha
+    # square_multiply: multiplies powers of x, ceil(log2(alpha)) rounds and
+    #         no preprocessing beyond multiplication triples
+    SBOX_STRATEGIES = ('masked', 'square_multiply')
+    # Partial round evaluation:
+    # single: one opening per partial round
+    # paired: opens the masked S-box inputs of two consecutive partial rounds
+    #         together, halving their rounds at the cost of preprocessing
+    #         O(alpha^3) monomials per pair (masked S-boxes only)
+    PARTIAL_STRATEGIES = ('single', 'paired')
+    # Instances built by instance(), keyed by parameter set and options
+    instances = {}
+    # Timers of the profiling mode, timer 1 measures the whole computation in
+    # the programs
+    PROFILE_TIMERS = {
+        'linear_e': 2,
+        'nonlinear_e': 3,
+        'linear_i': 4,
+        'nonlinear_i': 5,
+        'compress_hash': 6,
+    }
+
+    def __init__(self, p, t, Me, Mi, round_constants, unroll=0, sbox='masked',
+                 profile=False, partial='single'):
+        # Arithmetic is modulo the prime the program is compiled for, so any
+        # other prime than p silently gives wrong hashes
+        prime = getattr(Program.prog, 'prime', None)
+        assert prime, ('Poseidon2 needs the program to be compiled with -P %d' % p)
+        assert int(prime) == p, \
+            ('Program compiled for another prime than Poseidon2, compile with -P %d' % p, prime)
+        self.alpha = get_alpha(p)
         self.t = t
-        self.Me = cint.Matrix(t, t)
-        self.Me.assign(Me)
-        self.Mi = cint.Array(t)
-        self.Mi.assign(Mi)
-        Re, Ri = Poseidon2.find_FD_round_numbers(p, t, self.alpha, 128, Poseidon2.get_sbox_cost, True)
+        assert sbox in self.SBOX_STRATEGIES, sbox
+        self.sbox_strategy = sbox
+        assert partial in self.PARTIAL_STRATEGIES, partial
+        assert partial == 'single' or sbox == 'masked', \
+            ('Paired partial rounds need masked S-boxes', sbox)
+        self.partial_strategy = partial
+        # 0 unrolls chains and rounds in Python, k > 0 runs them in runtime
+        # loops with k steps per iteration
+        self.unroll = unroll
+        # Linear layers are kept as compile-time constants so that they can
+        # scale lanes of any width
+        self.Me = Me
+        self.Mi = Mi
+        self.M4 = external_m4(Me)
+        Re, Ri = round_numbers(p, t, self.alpha, 128, True)
         self.Re = Re
         self.Ri = Ri
         self.round_constants = cint.Matrix(Re + Ri, t) 
         self.round_constants.assign(round_constants)
+        self.round_constants_values = round_constants
+        self.lane_constants_cache = {1: self.round_constants}
+        # Without a pool, every masked S-box derives the powers of r from a
+        # random square online
+        self.power_tuples = None
+        self.pair_tuples = None
+        # Profiling puts a timer around every phase. Timers start new basic
+        # blocks, so rounds are no longer merged across phases and the
+        # profiled program is slower than the plain one.
+        self.profile = profile
+        if profile:
+            self.counters = {phase: [MemValue(regint(0)) for _ in range(3)]
+                             for phase in self.PROFILE_TIMERS}
 
-    @staticmethod
-    def get_alpha(p):
-        for alpha in range(3, p):
-            if gcd(alpha, p - 1) == 1:
-                break
-        return alpha
+    @classmethod
+    def instance(cls, field='koalabear', t=16, **kwargs):
+        """Returns a Poseidon2 instance for a registered field ('koalabear',
+        'babybear', 'goldilocks', 'bn254') and width, generating and caching
+        its parameters if they are not loaded"""
+        key = (cls, field, t, tuple(sorted(kwargs.items())))
+        if key not in cls.instances:
+            cls.instances[key] = cls(*instance_parameters(field, t), **kwargs)
+        return cls.instances[key]
+
+    @classmethod
+    def koalabear_compression(cls, **kwargs):
+        """Returns a Poseidon2 instance configured for KoalaBear prime in compression mode"""
+        return cls.instance('koalabear', 16, **kwargs)
 
     @staticmethod
-    def find_FD_round_numbers(p, t, alpha, M, cost_function, security_margin):
-        n = ceil(log(p, 2))
-        N = int(n * t)
-        sat_inequiv = Poseidon2.sat_inequiv_alpha
-        R_P = 0
-        R_F = 0
-        min_cost = float("inf")
-        max_cost_rf = 0
-        # Brute-force approach
-        for R_P_t in range(1, 500):
-            for R_F_t in range(4, 100):
-                if R_F_t % 2 == 0:
-                    if (sat_inequiv(p, t, R_F_t, R_P_t, alpha, M) == True):
-                        if security_margin == True:
-                            R_F_t += 2
-                            R_P_t = int(ceil(float(R_P_t) * 1.075))
-                        cost = cost_function(R_F_t, R_P_t, N, t)
-                        if (cost < min_cost) or ((cost == min_cost) and (R_F_t < max_cost_rf)):
-                            R_P = ceil(R_P_t)
-                            R_F = ceil(R_F_t)
-                            min_cost = cost
-                            max_cost_rf = R_F
-        return (int(R_F), int(R_P))
+    def options_from_args(args):
+        """Reads 'unroll=<k>', 'sbox=<strategy>', 'partial=<strategy>' and
+        'profile' program arguments as keyword arguments for the
+        constructors"""
+        options = {}
+        for arg in args:
+            if arg.startswith('unroll='):
+                options['unroll'] = int(arg[len('unroll='):])
+            elif arg.startswith('sbox='):
+                options['sbox'] = arg[len('sbox='):]
+            elif arg.startswith('partial='):
+                options['partial'] = arg[len('partial='):]
+            elif arg == 'profile':
+                options['profile'] = True
+        return options
 
     @staticmethod
-    def sat_inequiv_alpha(p, t, R_F, R_P, alpha, M):
-        N = int(log(p,2) * t)
-        if alpha > 0:
-            R_F_1 = 6 if M <= ((floor(log(p, 2) - ((alpha-1)/2.0))) * (t + 1)) else 10 # Statistical
-            R_F_2 = 1 + ceil(log(2, alpha) * min(M, log(p,2))) + ceil(log(t, alpha)) - R_P # Interpolation
-            R_F_3 = (log(2, alpha) * min(M, log(p, 2))) - R_P # Groebner 1
-            R_F_4 = t - 1 + log(2, alpha) * min(M / float(t + 1), log(p, 2) / float(2)) - R_P # Groebner 2
-            R_F_5 = (t - 2 + (M / float(2 * log(alpha, 2))) - R_P) / float(t - 1) # Groebner 3
-            R_F_max = max(ceil(R_F_1), ceil(R_F_2), ceil(R_F_3), ceil(R_F_4), ceil(R_F_5))
-            
-            # Addition due to https://eprint.iacr.org/2023/537.pdf
-            r_temp = floor(t / 3.0)
-            over = (R_F - 1) * t + R_P + r_temp + r_temp * (R_F / 2.0) + R_P + alpha
-            under = r_temp * (R_F / 2.0) + R_P + alpha
-            binom_log = log(comb(int(over), int(under)), 2)
-            #if binom_log == inf:
-            #    binom_log = M + 1
-            cost_gb4 = ceil(2 * binom_log) # Paper uses 2.3727, we are more conservative here
-            return ((R_F >= R_F_max) and (cost_gb4 >= M))
+    def pool_from_args(args):
+        """Whether the program arguments ask for a pool of power tuples,
+        with 'powers' or with its earlier name 'cubes'"""
+        return 'powers' in args or 'cubes' in args
+
+    @classmethod
+    def from_args(cls, args):
+        """Returns the instance selected by 'field=<name>' and 't=<width>'
+        program arguments (KoalaBear, t = 16 by default) with the options
+        of options_from_args"""
+        field, t = 'koalabear', 16
+        for arg in args:
+            if arg.startswith('field='):
+                field = arg[len('field='):]
+            elif arg.startswith('t='):
+                t = int(arg[len('t='):])
+        return cls.instance(field, t, **cls.options_from_args(args))
+
+    def lane_constants(self, n):
+        """Returns the round constants with every entry repeated for n lanes"""
+        if n not in self.lane_constants_cache:
+            rc = cint.Matrix(self.Re + self.Ri, self.t * n)
+            for r, row in enumerate(self.round_constants_values):
+                for j, c in enumerate(row):
+                    rc[r].assign_vector(cint(c, size=n), base=j * n)
+            self.lane_constants_cache[n] = rc
+        return self.lane_constants_cache[n]
+
+    def to_lanes(self, states):
+        """Transposes a sint.Matrix(N, t) of states into t lanes of width N"""
+        lanes = sint.Matrix(self.t, len(states))
+        for j in range(self.t):
+            lanes[j].assign_vector(states.get_column(j))
+        return lanes
+
+    def from_lanes(self, lanes):
+        states = sint.Matrix(lanes.sizes[1], self.t)
+        for j in range(self.t):
+            states.set_column(j, lanes[j].get_vector())
+        return states
+
+    def addrc_e(self, lanes, r):
+        rc = self.lane_constants(lanes.sizes[1])
+        lanes.assign_vector(lanes.get_vector() + rc[r].get_vector())
+        return lanes
+
+    def addrc_i(self, lanes, r):
+        n = lanes.sizes[1]
+        rc = self.lane_constants(n)
+        lanes[0].assign_vector(lanes[0].get_vector() + rc[r].get_vector(0, n))
+        return lanes
+
+    def start_phase(self, name):
+        if self.profile:
+            start_timer(self.PROFILE_TIMERS[name])
+
+    def stop_phase(self, name):
+        if self.profile:
+            stop_timer(self.PROFILE_TIMERS[name])
+            self.counters[name][0].iadd(1)
+
+    def count_sboxes(self, name, n):
+        """Adds the openings and random squares of n S-boxes to the phase"""
+        if not self.profile:
+            return
+        # Every multiplication opens two masked values
+        if self.sbox_strategy == 'masked':
+            openings, squares = n, 0
+            if self.power_tuples is None:
+                mults = power_multiplications((1, 2), range(1, self.alpha + 1))
+                openings += 2 * n * mults
+                squares = n
         else:
-            print("Invalid value for alpha!")
-            exit(1)
+            mults = power_multiplications((1,), (self.alpha,))
+            openings, squares = 2 * n * mults, 0
+        self.counters[name][1].iadd(openings)
+        self.counters[name][2].iadd(squares)
 
+    def count_pairs(self, name, n):
+        """Adds the openings and random squares of n pairs of partial round
+        S-boxes to the phase"""
+        if not self.profile:
+            return
+        openings, squares = 2 * n, 0
+        if self.pair_tuples is None:
+            openings += 2 * n * pair_multiplications(self.alpha)
+            squares = 2 * n
+        self.counters[name][1].iadd(openings)
+        self.counters[name][2].iadd(squares)
 
-    @classmethod
-    def koalabear_compression(cls):
-        """Returns a Poseidon2 instance configured for KoalaBear prime in compression mode"""
-        p = 2**31 - 2**24 + 1
-        t = 16
-        Me = [
-            [10, 14, 2, 6, 5, 7, 1, 3, 5, 7, 1, 3, 5, 7, 1, 3],
-            [8, 12, 2, 2, 4, 6, 1, 1, 4, 6, 1, 1, 4, 6, 1, 1],
-            [2, 6, 10, 14, 1, 3, 5, 7, 1, 3, 5, 7, 1, 3, 5, 7],
-            [2, 2, 8, 12, 1, 1, 4, 6, 1, 1, 4, 6, 1, 1, 4, 6],
-            [5, 7, 1, 3, 10, 14, 2, 6, 5, 7, 1, 3, 5, 7, 1, 3],
-            [4, 6, 1, 1, 8, 12, 2, 2, 4, 6, 1, 1, 4, 6, 1, 1],
-            [1, 3, 5, 7, 2, 6, 10, 14, 1, 3, 5, 7, 1, 3, 5, 7],
-            [1, 1, 4, 6, 2, 2, 8, 12, 1, 1, 4, 6, 1, 1, 4, 6],
-            [5, 7, 1, 3, 5, 7, 1, 3, 10, 14, 2, 6, 5, 7, 1, 3],
-            [4, 6, 1, 1, 4, 6, 1, 1, 8, 12, 2, 2, 4, 6, 1, 1],
-            [1, 3, 5, 7, 1, 3, 5, 7, 2, 6, 10, 14, 1, 3, 5, 7],
-            [1, 1, 4, 6, 1, 1, 4, 6, 2, 2, 8, 12, 1, 1, 4, 6],
-            [5, 7, 1, 3, 5, 7, 1, 3, 5, 7, 1, 3, 10, 14, 2, 6],
-            [4, 6, 1, 1, 4, 6, 1, 1, 4, 6, 1, 1, 8, 12, 2, 2],
-            [1, 3, 5, 7, 1, 3, 5, 7, 1, 3, 5, 7, 2, 6, 10, 14],
-            [1, 1, 4, 6, 1, 1, 4, 6, 1, 1, 4, 6, 2, 2, 8, 12]
-        ]
-        Mi = [479859441, 1064293388, 236801731, 325174860, 162067567, 64109119, 278581903, 683867015, 996448497, 1960361558, 1782740945, 415413203, 1649591051, 130819423, 547348826, 1386569643]
-        round_constants = [
-            [2128964168, 288780357, 316938561, 2126233899, 426817493, 1714118888, 1045008582, 1738510837, 889721787, 8866516, 681576474, 419059826, 1596305521, 1583176088, 1584387047, 1529751136],
-            [1863858111, 1072044075, 517831365, 1464274176, 1138001621, 428001039, 245709561, 1641420379, 1365482496, 770454828, 693167409, 757905735, 136670447, 436275702, 525466355, 1559174242],
-            [1030087950, 869864998, 322787870, 267688717, 948964561, 740478015, 679816114, 113662466, 2066544572, 1744924186, 367094720, 1380455578, 1842483872, 416711434, 1342291586, 1692058446],
-            [1493348999, 1113949088, 210900530, 1071655077, 610242121, 1136339326, 2020858841, 1019840479, 678147278, 1678413261, 1361743414, 61132629, 1209546658, 64412292, 1936878279, 1980661727],
-            [1423960925, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [2101391318, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1915532054, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [275400051, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1168624859, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1141248885, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [356546469, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1165250474, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1320543726, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [932505663, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1204226364, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1452576828, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1774936729, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [926808140, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1184948056, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1186493834, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [843181003, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [185193011, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [452207447, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [510054082, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [1139268644, 630873441, 669538875, 462500858, 876500520, 1214043330, 383937013, 375087302, 636912601, 307200505, 390279673, 1999916485, 1518476730, 1606686591, 1410677749, 1581191572],
-            [1004269969, 143426723, 1747283099, 1016118214, 1749423722, 66331533, 1177761275, 1581069649, 1851371119, 852520128, 1499632627, 1820847538, 150757557, 884787840, 619710451, 1651711087],
-            [505263814, 212076987, 1482432120, 1458130652, 382871348, 417404007, 2066495280, 1996518884, 902934924, 582892981, 1337064375, 1199354861, 2102596038, 1533193853, 1436311464, 2012303432],
-            [839997195, 1225781098, 2011967775, 575084315, 1309329169, 786393545, 995788880, 1702925345, 1444525226, 908073383, 1811535085, 1531002367, 1635653662, 1585100155, 867006515, 879151050]
-        ]
-        return cls(p, t, Me, Mi, round_constants)
+    def print_profile(self):
+        """Prints the counters of every phase, to be read together with the
+        timer output by parse_logs.py"""
+        if not self.profile:
+            return
+        for name, timer in self.PROFILE_TIMERS.items():
+            calls, openings, squares = self.counters[name]
+            print_ln('Poseidon2 profile %s: timer %s, %s calls, %s openings, %s squares',
+                     name, timer, calls.read(), openings.read(), squares.read())
 
-    @staticmethod
-    def get_sbox_cost(R_F, R_P, N, t):
-        return int(t * R_F + R_P)
+    def sbox_count(self, permutations=1):
+        """Number of S-boxes used by permutations"""
+        return permutations * (self.t * self.Re + self.Ri)
 
-    def addrc_e(self, state, r):
-        for i in range(self.t):
-            state[i] = state[i] + self.round_constants[r][i]
-        return state
+    def pair_count(self, permutations=1):
+        """Number of paired partial rounds, and thus of pair monomial
+        tuples, used by permutations"""
+        if self.partial_strategy != 'paired':
+            return 0
+        return permutations * (self.Ri // 2)
 
-    def addrc_i(self, state, r):
-        state[0] = state[0] + self.round_constants[r][0]
-        return state
+    def sponge_permutations(self, length, output_length=None, rate=None):
+        """Number of permutations of a sponge hash of length elements"""
+        return sponge_permutations(self.t, length, output_length, rate)
 
-    def compute_cube(self, x):
-        r, rsq = sint.get_random_square()
-        r_cube = r * rsq
-        y = (x - r).reveal()
-        return 3 * y * rsq + 3 * y ** 2 * r + y ** 3 + r_cube
+    def keygen_permutations(self, height, chunks, w):
+        """Number of permutations of the key generation of leansig_keygen.mpc,
+        to size the pool of preprocess_powers"""
+        return keygen_permutations(self.t, height, chunks, w)
 
-    def pow_7(self, x):
-        x2 = x * x
-        x6 = self.compute_cube(x2)
-        return x * x6
+    def preprocess_powers(self, permutations):
+        """Generates a pool of power tuples (and pair monomials for paired
+        partial rounds) for the given number of permutations, to be called
+        before the online computation"""
+        if self.sbox_strategy != 'masked':
+            return None
+        pairs = self.pair_count(permutations)
+        singles = self.sbox_count(permutations) - 2 * pairs
+        print('Poseidon2 uses %d power tuples of degree %d' % (singles, self.alpha))
+        self.power_tuples = PowerTuples(singles, self.alpha)
+        self.power_tuples.generate()
+        if pairs:
+            print('Poseidon2 uses %d pair monomial tuples' % pairs)
+            self.pair_tuples = PairTuples(pairs, self.alpha)
+            self.pair_tuples.generate()
+        return self.power_tuples
 
-    def nonlinear_e(self, state):
-        for i in range(self.t):
-            state[i] = self.compute_cube(state[i])
-            #state[i] = self.pow_7(state[i])
-            #state[i] = state[i] ** self.alpha
-        return state
-
-    def nonlinear_i(self, state):
-        state[0] = self.compute_cube(state[0])
-        #state[0] = self.pow_7(state[0])
-        #state[0] = state[0] ** 2
-        return state
-
-    def linear_e(self, state):
-        out = sint.Array(self.t)
+    def random_powers(self, n, e):
+        """Returns [r, r^2, ..., r^e] for n random values r"""
+        if self.power_tuples is not None:
+            assert self.power_tuples.degree >= e
+            return self.power_tuples.take(n)[:e]
+        r, r2 = sint.get_random_square(size=n)
+        powers = {1: r, 2: r2}
+        return [extend_powers(powers, i) for i in range(1, e + 1)]
+
+    def pow_masked(self, x, e):
+        """Raises a (possibly vectorized) sint to the power e with a single
+        batched opening of y = x - r, as the sum of C(e, i) y^(e-i) r^i"""
+        r = self.random_powers(x.size, e)
+        y = (x - r[0]).reveal()
+        y_powers = [1, y]
+        for i in range(2, e + 1):
+            y_powers.append(y_powers[-1] * y)
+        res = y_powers[e] + r[e - 1]
+        for i in range(1, e):
+            res += comb(e, i) * y_powers[e - i] * r[i - 1]
+        return res
+
+    def random_pair(self, n):
+        """Returns {(m, k): r^m r'^k} for n random pairs r, r'"""
+        if self.pair_tuples is not None:
+            return self.pair_tuples.take(n)
+        return random_pair_monomials(n, self.alpha)
+
+    def pow_paired(self, s, b):
+        """Returns s^alpha and (a s^alpha + b)^alpha, a = 1 + Mi[0], for
+        (possibly vectorized) sints s and b with a single batched opening of
+        y = s - r and z = b - r'. With P(r) = a (y + r)^alpha + z, the second
+        power is the sum of C(alpha, k) P(r)^(alpha-k) r'^k, a combination
+        of the monomials r^m r'^k with public coefficients."""
+        e = self.alpha
+        monomials = self.random_pair(s.size)
+        monomials[(0, 0)] = 1
+        # Both openings are independent, so the compiler merges them into
+        # one round
+        y = (s - monomials[(1, 0)]).reveal()
+        z = (b - monomials[(0, 1)]).reveal()
+        y_powers = [1, y]
+        for i in range(2, e + 1):
+            y_powers.append(y_powers[-1] * y)
+        # Coefficients in r of (y + r)^alpha and of the powers of P(r)
+        coefficients = [comb(e, i) * y_powers[e - i] for i in range(e + 1)]
+        P = [(1 + self.Mi[0]) * c for c in coefficients]
+        P[0] = P[0] + z
+        P_powers = [[1], P]
+        for i in range(2, e + 1):
+            P_powers.append(poly_mul(P_powers[-1], P))
+        first = sum(c * monomials[(m, 0)] for m, c in enumerate(coefficients))
+        second = sum(comb(e, k) * c * monomials[(m, k)]
+                     for k in range(e + 1) for m, c in enumerate(P_powers[e - k]))
+        return first, second
+
+    def pow_square_multiply(self, x, e):
+        return extend_powers({1: x}, e)
+
+    def sbox(self, x):
+        if self.sbox_strategy == 'masked':
+            return self.pow_masked(x, self.alpha)
+        return self.pow_square_multiply(x, self.alpha)
+
+    def nonlinear_e(self, lanes):
+        lanes.assign_vector(self.sbox(lanes.get_vector()))
+        self.count_sboxes('nonlinear_e', lanes.total_size())
+        return lanes
+
+    def nonlinear_i(self, lanes):
+        lanes[0].assign_vector(self.sbox(lanes[0].get_vector()))
+        self.count_sboxes('nonlinear_i', lanes.sizes[1])
+        return lanes
+
+    def mul_m4(self, x):
+        if self.M4 == M4:
+            # Addition chain for M4 from the Poseidon2 paper
+            t0 = x[0] + x[1]
+            t1 = x[2] + x[3]
+            t2 = 2 * x[1] + t1
+            t3 = 2 * x[3] + t0
+            t4 = 4 * t1 + t3
+            t5 = 4 * t0 + t2
+            return [t3 + t5, t5, t2 + t4, t4]
+        return [sum(self.M4[i][j] * x[j] for j in range(4)) for i in range(4)]
+
+    def linear_e(self, lanes):
+        """Applies circ(2*M4, M4, ..., M4) as M4 on every 4-lane block plus
+        the sum of all blocks, falling back to the dense product"""
+        if self.M4 is None:
+            return self.linear_e_dense(lanes)
+        x = [lanes[j].get_vector() for j in range(self.t)]
+        y = []
+        for k in range(0, self.t, 4):
+            y += self.mul_m4(x[k:k + 4])
+        sums = [sum(y[i::4]) for i in range(4)]
+        for j in range(self.t):
+            lanes[j].assign_vector(y[j] + sums[j % 4])
+        return lanes
+
+    def linear_e_dense(self, lanes):
+        x = [lanes[j].get_vector() for j in range(self.t)]
         for i in range(self.t):
-            for j in range(self.t):
-        #@for_range_opt([t, t])
-        #def f(i, j):
-                out[i] = out[i] + self.Me[i][j] * state[j]
-        return out
+            lanes[i].assign_vector(sum(self.Me[i][j] * x[j] for j in range(self.t)))
+        return lanes
 
-    def linear_i(self, state):
-        sum_ = sum(s for s in state)
+    def linear_i(self, lanes):
+        x = [lanes[j].get_vector() for j in range(self.t)]
+        sum_ = sum(x)
         for i in range(self.t):
-            state[i] = sum_ + self.Mi[i] * state[i]
-        return state
-
-    def permutation(self, state):
-        state = self.linear_e(state)
-        for r in range(self.Re//2):
-        #@for_range_opt(self.Re//2)
-        #def _(i):
-            state = self.addrc_e(state, r)
-            state = self.nonlinear_e(state)
-            state = self.linear_e(state)
-        for r in range(self.Ri):
-        #@for_range_opt(self.Ri)
-        #def _(i):
-            state = self.addrc_i(state, r + self.Re//2)
-            state = self.nonlinear_i(state)
-            state = self.linear_i(state)
-        for r in range(self.Re//2):
-        #@for_range_opt(self.Re//2)
-        #def _(i):
-            state = self.addrc_e(state, r + self.Re//2 + self.Ri)
-            state = self.nonlinear_e(state)
-            state = self.linear_e(state)
-        return state
-
-    def compress_hash(self, input):
+            lanes[i].assign_vector(sum_ + self.Mi[i] * x[i])
+        return lanes
+
+    def loop(self, n, unroll, body):
+        """Calls body(i) for i in range(n), either unrolled or with unroll
+        calls per iteration of a runtime loop"""
+        unroll = self.unroll if unroll is None else unroll
+        if not unroll or n <= unroll:
+            for i in range(n):
+                body(i)
+            return
+        @for_range(n // unroll)
+        def _(i):
+            for k in range(unroll):
+                body(i * unroll + k)
+        for i in range(n - n % unroll, n):
+            body(i)
+
+    def permute_lanes(self, lanes, unroll=None):
+        """Applies the permutation in place to every state held in lanes"""
+        # Fill the lane constants before any runtime loop reads them
+        self.lane_constants(lanes.sizes[1])
+
+        def full_round(r):
+            self.addrc_e(lanes, r)
+            self.start_phase('nonlinear_e')
+            self.nonlinear_e(lanes)
+            self.stop_phase('nonlinear_e')
+            self.start_phase('linear_e')
+            self.linear_e(lanes)
+            self.stop_phase('linear_e')
+
+        def partial_round(r):
+            self.addrc_i(lanes, r)
+            self.start_phase('nonlinear_i')
+            self.nonlinear_i(lanes)
+            self.stop_phase('nonlinear_i')
+            self.start_phase('linear_i')
+            self.linear_i(lanes)
+            self.stop_phase('linear_i')
+
+        self.start_phase('linear_e')
+        self.linear_e(lanes)
+        self.stop_phase('linear_e')
+        def paired_rounds(r):
+            # The S-box input of round r + 1 is a s^alpha + b, with b known
+            # before round r
+            n = lanes.sizes[1]
+            self.addrc_i(lanes, r)
+            x = [lanes[j].get_vector() for j in range(self.t)]
+            b = sum(x[1:]) + self.lane_constants(n)[r + 1].get_vector(0, n)
+            self.start_phase('nonlinear_i')
+            first, second = self.pow_paired(x[0], b)
+            self.count_pairs('nonlinear_i', n)
+            self.stop_phase('nonlinear_i')
+            self.start_phase('linear_i')
+            lanes[0].assign_vector(first)
+            self.linear_i(lanes)
+            lanes[0].assign_vector(second)
+            self.linear_i(lanes)
+            self.stop_phase('linear_i')
+
+        self.loop(self.Re//2, unroll, full_round)
+        if self.partial_strategy == 'paired':
+            self.loop(self.Ri // 2, unroll, lambda i: paired_rounds(2 * i + self.Re//2))
+            # An odd last round is evaluated on its own
+            if self.Ri % 2:
+                partial_round(self.Re//2 + self.Ri - 1)
+        else:
+            self.loop(self.Ri, unroll, lambda r: partial_round(r + self.Re//2))
+        self.loop(self.Re//2, unroll, lambda r: full_round(r + self.Re//2 + self.Ri))
+        return lanes
+
+    def compress_lanes(self, lanes, unroll=None):
+        self.start_phase('compress_hash')
+        input = lanes.get_vector()
+        lanes = self.permute_lanes(lanes, unroll)
+        lanes.assign_vector(lanes.get_vector() + input)
+        self.stop_phase('compress_hash')
+        return lanes
+
+    def chain_lanes(self, lanes, chainlen, unroll=None):
+        self.lane_constants(lanes.sizes[1])
+        self.loop(chainlen, unroll, lambda i: self.compress_lanes(lanes, unroll))
+        return lanes
+
+    def permutation(self, state, unroll=None):
+        lanes = sint.Matrix(self.t, 1)
+        lanes.assign_vector(state.get_vector())
+        output = sint.Array(self.t)
+        output.assign_vector(self.permute_lanes(lanes, unroll).get_vector())
+        return output
+
+    def permutation_batch(self, states, unroll=None):
+        """Permutes the N rows of a sint.Matrix(N, t) in lockstep"""
+        return self.from_lanes(self.permute_lanes(self.to_lanes(states), unroll))
+
+    def compress_hash(self, input, unroll=None):
         assert len(input) <= self.t, ('Input does not fit into state')
+        self.start_phase('compress_hash')
         output = sint.Array(self.t)
-        output = self.permutation(input)
+        output = self.permutation(input, unroll)
         output[:] += input[:]
+        self.stop_phase('compress_hash')
         return output
 
-    def hash_chain(self, input, chainlen):
-        #output = sint.Array(t)
-        output = input
-        for i in range(chainlen):
-            output = self.compress_hash(output)
-        '''
-        @for_range_opt(chainlen)
-        def _(i):
-            output[:] = self.compress_hash(output[:])
-        '''
+    def compress_hash_batch(self, inputs, unroll=None):
+        return self.from_lanes(self.compress_lanes(self.to_lanes(inputs), unroll))
+
+    def hash_chain(self, input, chainlen, unroll=None):
+        lanes = sint.Matrix(self.t, 1)
+        lanes.assign_vector(input.get_vector())
+        output = sint.Array(self.t)
+        output.assign_vector(self.chain_lanes(lanes, chainlen, unroll).get_vector())
         return output
 
-    def ots(self, input, chainlen, chunks):
-        output = sint.Matrix(chunks, self.t)
-        for i in range(chunks):
-                output.assign(self.hash_chain(input[i],chainlen), i)
+    def hash_chain_batch(self, inputs, chainlen, unroll=None):
+        return self.from_lanes(self.chain_lanes(self.to_lanes(inputs), chainlen, unroll))
+
+    def default_rate(self):
+        """Rate of the sponge mode, leaving half of the state as capacity"""
+        return self.t - self.t // 2
+
+    def sponge_hash(self, message, output_length=None, rate=None, unroll=None):
+        """Hashes a sint.Array of any length with the sponge construction,
+        returning a sint.Array of output_length elements (the rate by
+        default)"""
+        messages = sint.Matrix(1, len(message))
+        messages.assign_vector(message.get_vector())
+        digests = self.sponge_hash_batch(messages, output_length, rate, unroll)
+        output = sint.Array(digests.sizes[1])
+        output.assign_vector(digests.get_vector())
         return output
 
+    def sponge_hash_batch(self, messages, output_length=None, rate=None, unroll=None):
+        """Hashes the N rows of a sint.Matrix(N, L) with N sponges that
+        share every permutation, so the online rounds are those of a single
+        message. Rate elements are absorbed by addition per permutation
+        after padding with 1 and zeros (pad10*); the capacity
+        t - rate starts at zero and is never output."""
+        rate = rate or self.default_rate()
+        assert 0 < rate < self.t, ('Sponge needs a nonzero rate and capacity', rate)
+        output_length = output_length or rate
+        n, length = messages.sizes
+        blocks = length // rate + 1
+
+        # Message lanes: row j holds element j of all messages, followed by
+        # the padding
+        padded = sint.Matrix(blocks * rate, n)
+        padded.assign_all(0)
+        if length:
+            padded.assign_vector(messages.transpose().get_vector())
+        padded[length].assign_all(1)
+
+        lanes = sint.Matrix(self.t, n)
+        lanes.assign_all(0)
+        self.lane_constants(n)
+
+        def absorb(b):
+            lanes.assign_vector(lanes.get_vector(0, rate * n) +
+                                padded.get_vector(b * rate * n, rate * n))
+            self.permute_lanes(lanes, unroll)
+
+        self.loop(blocks, unroll, absorb)
+
+        digests = sint.Matrix(n, output_length)
+        for k in range(output_length):
+            if k and k % rate == 0:
+                self.permute_lanes(lanes, unroll)
+            digests.set_column(k, lanes[k % rate].get_vector())
+        return digests
+
+    def hash_chains(self, inputs, chainlens, unroll=None):
+        """Advances row i of inputs by chainlens[i] compressions. All chains
+        share their openings, so the online rounds are those of a single
+        chain of length max(chainlens). chainlens is either a list of public
+        lengths or a cint.Array holding them at runtime"""
+        if isinstance(chainlens, (list, tuple)):
+            return self.hash_chains_static(inputs, chainlens, unroll)
+        return self.hash_chains_runtime(inputs, chainlens, unroll)
+
+    def hash_chains_static(self, inputs, chainlens, unroll=None):
+        n = len(inputs)
+        assert len(chainlens) == n
+        # Longest chains first so that the active set is always a prefix
+        order = sorted(range(n), key=lambda i: -chainlens[i])
+        sorted_inputs = sint.Matrix(n, self.t)
+        for k, i in enumerate(order):
+            sorted_inputs[k].assign_vector(inputs[i].get_vector())
+        lanes = self.to_lanes(sorted_inputs)
+        active = lanes
+        step = 0
+        while step < max(chainlens, default=0):
+            width = sum(1 for l in chainlens if l > step)
+            # Steps until the next chain finishes share the same active set
+            segment = min(l for l in chainlens if l > step) - step
+            if width < active.sizes[1]:
+                # Retire finished chains and compact the active set
+                compacted = sint.Matrix(self.t, width)
+                for j in range(self.t):
+                    if active is not lanes:
+                        lanes[j].assign_vector(active[j].get_vector(width, active.sizes[1] - width), base=width)
+                    compacted[j].assign_vector(active[j].get_vector(0, width))
+                active = compacted
+            active = self.chain_lanes(active, segment, unroll)
+            step += segment
+        if active is not lanes:
+            for j in range(self.t):
+                lanes[j].assign_vector(active[j].get_vector())
+        sorted_outputs = self.from_lanes(lanes)
+        outputs = sint.Matrix(n, self.t)
+        for k, i in enumerate(order):
+            outputs[i].assign_vector(sorted_outputs[k].get_vector())
+        return outputs
+
+    def hash_chains_runtime(self, inputs, chainlens, unroll=None):
+        n = len(inputs)
+        assert len(chainlens) == n
+        lanes = self.to_lanes(inputs)
+        # Fill the lane constants outside of the runtime loop
+        self.lane_constants(n)
+        remaining = cint.Array(n)
+        remaining.assign_vector(chainlens.get_vector())
+        steps = chainlens[0]
+        for i in range(1, n):
+            steps = (chainlens[i] > steps) * (chainlens[i] - steps) + steps
+
+        # Every step advances all chains and keeps the result only for those
+        # which have not reached their length yet
+        @for_range(regint(steps))
+        def _(step):
+            rem = remaining.get_vector()
+            active = rem > 0
+            previous = [lanes[j].get_vector() for j in range(self.t)]
+            self.compress_lanes(lanes, unroll)
+            for j in range(self.t):
+                lanes[j].assign_vector(previous[j] + active * (lanes[j].get_vector() - previous[j]))
+            remaining.assign_vector(rem - active)
+
+        return self.from_lanes(lanes)
+
+    def ots(self, input, chainlen, chunks, unroll=None):
+        assert len(input) == chunks
+        return self.hash_chain_batch(input, chainlen, unroll)
+
+    def merkle_compress_batch(self, children, unroll=None):
+        """Compresses the N rows of a sint.Matrix(N, t), each the
+        concatenation of a left and a right digest of t/2 elements, into the
+        sint.Matrix(N, t/2) of their parents: the first t/2 elements of
+        compress_hash"""
+        assert self.t % 2 == 0, ('Merkle trees need an even state width', self.t)
+        lanes = self.compress_lanes(self.to_lanes(children), unroll)
+        parents = sint.Matrix(len(children), self.t // 2)
+        for j in range(self.t // 2):
+            parents.set_column(j, lanes[j].get_vector())
+        return parents
+
+    def merkle_root_from_path(self, leaf, index, path, unroll=None):
+        """Recomputes the root from a leaf digest, its public index and its
+        authentication path (a Matrix with one sibling per level, as
+        returned by MerkleTree.auth_path)"""
+        d = self.t // 2
+        node = sint(leaf.get_vector(), size=d)
+        for level in range(len(path)):
+            children = sint.Matrix(1, self.t)
+            sibling = path[level].get_vector()
+            children.assign_vector(sibling if index & 1 else node, 0)
+            children.assign_vector(node if index & 1 else sibling, d)
+            node = self.merkle_compress_batch(children, unroll).get_vector()
+            index //= 2
+        root = sint.Array(d)
+        root.assign_vector(node)
+        return root
+
+class MerkleTree:
+    """Binary Merkle tree over digests of t/2 elements, with the first t/2
+    elements of compress_hash(left || right) as inner nodes. Every level is
+    hashed as one batch, so n leaves take log2(n) sequential permutations.
+    Leaves may be secret (sint) or public (cint); public ones are shared
+    without communication. Level 0 holds the leaves and the last level the
+    root, each as a sint.Matrix(nodes, t/2)."""
+
+    def __init__(self, poseidon2, leaves, unroll=None):
+        n = len(leaves)
+        assert n and n & (n - 1) == 0, ('Number of leaves must be a power of two', n)
+        self.poseidon2 = poseidon2
+        self.digest_size = poseidon2.t // 2
+        self.unroll = unroll
+        self.height = n.bit_length() - 1
+        self.levels = [self.shared(leaves)]
+        for level in range(self.height):
+            # Siblings are adjacent rows, so the nodes of a level read as
+            # the concatenated children of the next one
+            children = sint.Matrix(n >> (level + 1), poseidon2.t)
+            children.assign_vector(self.levels[level].get_vector())
+            self.levels.append(poseidon2.merkle_compress_batch(children, unroll))
+
+    def shared(self, digests):
+        assert digests.sizes[1] == self.digest_size, ('Wrong digest size', digests.sizes)
+        result = sint.Matrix(*digests.sizes)
+        vector = digests.get_vector()
+        result.assign_vector(sint(vector, size=vector.size))
+        return result
+
+    @property
+    def root(self):
+        root = sint.Array(self.digest_size)
+        root.assign_vector(self.levels[-1].get_vector())
+        return root
+
+    def auth_path(self, index):
+        """Returns the siblings of the path from the leaf at the public index
+        to the root, as a sint.Matrix(height, t/2)"""
+        path = sint.Matrix(self.height, self.digest_size)
+        for level in range(self.height):
+            path[level].assign_vector(self.levels[level][index ^ 1].get_vector())
+            index //= 2
+        return path
+
+    def update(self, indices, leaves):
+        """Replaces the leaves at the public indices by the rows of leaves and
+        rehashes only the nodes above them, one batch per level, instead of
+        rebuilding the tree"""
+        assert len(indices) == len(leaves)
+        leaves = self.shared(leaves)
+        for i, index in enumerate(indices):
+            self.levels[0][index].assign_vector(leaves[i].get_vector())
+        t = self.poseidon2.t
+        nodes = sorted(set(indices))
+        for level in range(self.height):
+            nodes = sorted(set(index // 2 for index in nodes))
+            children = sint.Matrix(len(nodes), t)
+            for i, index in enumerate(nodes):
+                children[i].assign_vector(self.levels[level].get_vector(index * t, t))
+            parents = self.poseidon2.merkle_compress_batch(children, self.unroll)
+            for i, index in enumerate(nodes):
+                self.levels[level + 1][index].assign_vector(parents[i].get_vector())
+
+class OTSPool:
+    """Pool of one-time LeanSig keys whose chains are computed ahead of
+    signing and kept as shares in Persistence/Transactions-P<i>.data. Key k
+    occupies key_size shares from k * key_size on: its chunks chains one
+    after the other, each as its w positions of t elements. Signing reads
+    only the positions selected by the encoded message and evaluates no
+    Poseidon2 at all."""
+
+    def __init__(self, poseidon2, chunks, w):
+        self.poseidon2 = poseidon2
+        self.chunks = chunks
+        self.w = w
+        self.key_size = chunks * w * poseidon2.t
+
+    def refill(self, start, count, unroll=None):
+        """Generates count keys from random seeds, advancing all their chains
+        as one batch, and writes them as keys start, ..., start + count - 1
+        (start may be a runtime value)"""
+        t = self.poseidon2.t
+        n = count * self.chunks
+        lanes = sint.Matrix(t, n)
+        lanes.assign_vector(sint.get_random(size=t * n))
+        keys = sint.Matrix(n, self.w * t)
+        for x in range(self.w):
+            if x:
+                self.poseidon2.compress_lanes(lanes, unroll)
+            for j in range(t):
+                keys.set_column(x * t + j, lanes[j].get_vector())
+        sint.write_to_file(keys.get_vector(), regint(start) * self.key_size)
 
+    def select(self, key, enc_msg):
+        """Returns the positions enc_msg[c] of the chains of key as a
+        sint.Matrix(chunks, t). key and enc_msg may be runtime values; a
+        position outside the chain would read another chain and aborts."""
+        t = self.poseidon2.t
+        signature = sint.Matrix(self.chunks, t)
+        for c in range(self.chunks):
+            x = regint(enc_msg[c])
+            runtime_error_if(x >= self.w, 'encoded message exceeds the chain length')
+            position = regint(key) * self.key_size + (c * self.w + x) * t
+            _, shares = sint.read_from_file(position, 1, size=t)
+            signature[c].assign_vector(shares[0])
+        return signature
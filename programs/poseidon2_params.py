@@ -0,0 +1,450 @@
+"""Poseidon2 parameter derivation. This module does not depend on the MP-SPDZ
+compiler so that it can also be used by cleartext tools."""
+
+import json
+import os
+from functools import lru_cache
+from math import ceil, log, gcd, floor, comb
+
+KOALABEAR = 2**31 - 2**24 + 1
+BABYBEAR = 2**31 - 2**27 + 1
+GOLDILOCKS = 2**64 - 2**32 + 1
+BN254 = 0x30644e72e131a029b85045b68181585d2833e84879b9709143e1f593f0000001
+
+# (p, t, alpha, M, security_margin) -> (R_F, R_P) as returned by
+# find_FD_round_numbers with get_sbox_cost
+ROUND_NUMBERS = {
+    # KoalaBear
+    (KOALABEAR, 8, 3, 128, True): (8, 19),
+    (KOALABEAR, 16, 3, 128, True): (8, 20),
+    (KOALABEAR, 24, 3, 128, True): (8, 23),
+    # BabyBear
+    (BABYBEAR, 8, 7, 128, True): (8, 12),
+    (BABYBEAR, 16, 7, 128, True): (8, 13),
+    (BABYBEAR, 24, 7, 128, True): (8, 21),
+    # Goldilocks
+    (GOLDILOCKS, 8, 7, 128, True): (8, 22),
+    (GOLDILOCKS, 16, 7, 128, True): (8, 22),
+    (GOLDILOCKS, 24, 7, 128, True): (8, 22),
+    # BN254 scalar field
+    (BN254, 2, 5, 128, True): (8, 56),
+    (BN254, 3, 5, 128, True): (8, 56),
+    (BN254, 4, 5, 128, True): (8, 56),
+    (BN254, 8, 5, 128, True): (8, 57),
+    (BN254, 16, 5, 128, True): (8, 57),
+    (BN254, 24, 5, 128, True): (8, 57),
+}
+
+FIELDS = {
+    'koalabear': KOALABEAR,
+    'babybear': BABYBEAR,
+    'goldilocks': GOLDILOCKS,
+    'bn254': BN254,
+}
+
+# 4x4 block of the external matrix from the Poseidon2 paper
+M4 = [
+    [5, 7, 1, 3],
+    [4, 6, 1, 1],
+    [1, 3, 5, 7],
+    [1, 1, 4, 6],
+]
+
+CACHE_FILE = os.environ.get('POSEIDON2_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'poseidon2', 'round_numbers.json'))
+
+
+def get_alpha(p):
+    for alpha in range(3, p):
+        if gcd(alpha, p - 1) == 1:
+            break
+    return alpha
+
+
+def get_sbox_cost(R_F, R_P, N, t):
+    return int(t * R_F + R_P)
+
+
+def sat_inequiv_alpha(p, t, R_F, R_P, alpha, M):
+    N = int(log(p,2) * t)
+    if alpha > 0:
+        R_F_1 = 6 if M <= ((floor(log(p, 2) - ((alpha-1)/2.0))) * (t + 1)) else 10 # Statistical
+        R_F_2 = 1 + ceil(log(2, alpha) * min(M, log(p,2))) + ceil(log(t, alpha)) - R_P # Interpolation
+        R_F_3 = (log(2, alpha) * min(M, log(p, 2))) - R_P # Groebner 1
+        R_F_4 = t - 1 + log(2, alpha) * min(M / float(t + 1), log(p, 2) / float(2)) - R_P # Groebner 2
+        R_F_5 = (t - 2 + (M / float(2 * log(alpha, 2))) - R_P) / float(t - 1) # Groebner 3
+        R_F_max = max(ceil(R_F_1), ceil(R_F_2), ceil(R_F_3), ceil(R_F_4), ceil(R_F_5))
+
+        # Addition due to https://eprint.iacr.org/2023/537.pdf
+        r_temp = floor(t / 3.0)
+        over = (R_F - 1) * t + R_P + r_temp + r_temp * (R_F / 2.0) + R_P + alpha
+        under = r_temp * (R_F / 2.0) + R_P + alpha
+        binom_log = log(comb(int(over), int(under)), 2)
+        #if binom_log == inf:
+        #    binom_log = M + 1
+        cost_gb4 = ceil(2 * binom_log) # Paper uses 2.3727, we are more conservative here
+        return ((R_F >= R_F_max) and (cost_gb4 >= M))
+    else:
+        print("Invalid value for alpha!")
+        exit(1)
+
+
+def find_FD_round_numbers(p, t, alpha, M, cost_function, security_margin):
+    """Returns the same (R_F, R_P) as a brute force over R_P < 500 and even
+    4 <= R_F < 100. Both conditions in sat_inequiv_alpha are monotone in R_F
+    and R_P, so for every R_F only the smallest secure R_P is a candidate. It
+    is found by bisection, and the search stops once the full rounds alone
+    cost more than the best candidate."""
+    n = ceil(log(p, 2))
+    N = int(n * t)
+    R_P = 0
+    R_F = 0
+    min_cost = float("inf")
+    for R_F_t in range(4, 100, 2):
+        margin_R_F = R_F_t + 2 if security_margin else R_F_t
+        if cost_function(margin_R_F, 1, N, t) > min_cost:
+            break
+        if not sat_inequiv_alpha(p, t, R_F_t, 499, alpha, M):
+            continue
+        low, high = 1, 499
+        while low < high:
+            mid = (low + high) // 2
+            if sat_inequiv_alpha(p, t, R_F_t, mid, alpha, M):
+                high = mid
+            else:
+                low = mid + 1
+        R_P_t = int(ceil(float(low) * 1.075)) if security_margin else low
+        cost = cost_function(margin_R_F, R_P_t, N, t)
+        # Ties go to fewer full rounds, as in the brute force
+        if (cost < min_cost) or ((cost == min_cost) and (margin_R_F < R_F)):
+            R_P = R_P_t
+            R_F = margin_R_F
+            min_cost = cost
+    return (int(R_F), int(R_P))
+
+
+def external_m4(Me):
+    """Returns the 4x4 block M4 if Me equals circ(2*M4, M4, ..., M4), None
+    if the external matrix lacks that structure"""
+    t = len(Me)
+    if t < 8 or t % 4:
+        return None
+    m4 = [row[4:8] for row in Me[:4]]
+    for i in range(t):
+        for j in range(t):
+            factor = 2 if i // 4 == j // 4 else 1
+            if Me[i][j] != factor * m4[i % 4][j % 4]:
+                return None
+    return m4
+
+
+def sponge_permutations(t, length, output_length=None, rate=None):
+    """Number of permutations of a sponge hash of length elements: one per
+    block of rate elements of the padded message, and one per further block
+    of output. The rate and output length default to those of
+    Poseidon2.sponge_hash_batch."""
+    rate = rate or t - t // 2
+    output_length = output_length or rate
+    return length // rate + 1 + (output_length - 1) // rate
+
+
+def keygen_permutations(t, height, chunks, w):
+    """Number of permutations of LeanSig key generation (leansig_keygen.mpc)
+    for 2^height one-time keys: the chains, the sponge hash of every public
+    key (t/2 elements per chain end) and the inner nodes of the Merkle
+    tree"""
+    leaves = 2**height
+    return leaves * chunks * (w - 1) + \
+        leaves * sponge_permutations(t, chunks * (t // 2), t // 2) + leaves - 1
+
+
+def load_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def store_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        tmp = '%s.%d' % (CACHE_FILE, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmp, CACHE_FILE)
+    except OSError:
+        pass
+
+
+@lru_cache(maxsize=None)
+def round_numbers(p, t, alpha, M=128, security_margin=True):
+    """Returns (R_F, R_P) from the built-in table, then the on-disk cache,
+    and only computes them if neither has an entry"""
+    key = (p, t, alpha, M, security_margin)
+    if key in ROUND_NUMBERS:
+        return ROUND_NUMBERS[key]
+    cache = load_cache()
+    cache_key = ','.join(str(k) for k in key)
+    if cache_key not in cache:
+        cache[cache_key] = find_FD_round_numbers(p, t, alpha, M, get_sbox_cost, security_margin)
+        store_cache(cache)
+    return tuple(cache[cache_key])
+
+
+def external_matrix(t):
+    """Returns the Poseidon2 external matrix for width t"""
+    if t == 2:
+        return [[2, 1], [1, 2]]
+    if t == 3:
+        return [[2, 1, 1], [1, 2, 1], [1, 1, 2]]
+    if t == 4:
+        return [row[:] for row in M4]
+    assert t % 4 == 0, ('Unsupported state width', t)
+    return [[(2 if i // 4 == j // 4 else 1) * M4[i % 4][j % 4] for j in range(t)]
+            for i in range(t)]
+
+
+def grain_bits(p, t, R_F, R_P):
+    """Yields the Grain LFSR bit stream of the Poseidon reference
+    implementation, initialised for a prime field and an x^alpha S-box"""
+    def bits(value, n):
+        return [int(b) for b in bin(value)[2:].zfill(n)]
+    state = bits(1, 2) + bits(0, 4) + bits(p.bit_length(), 12) + bits(t, 12) + \
+        bits(R_F, 10) + bits(R_P, 10) + [1] * 30
+
+    def step():
+        new_bit = state[62] ^ state[51] ^ state[38] ^ state[23] ^ state[13] ^ state[0]
+        state.pop(0)
+        state.append(new_bit)
+        return new_bit
+
+    for _ in range(160):
+        step()
+    while True:
+        # A bit is only output if the bit before it is 1
+        if step():
+            yield step()
+        else:
+            step()
+
+
+def grain_field_elements(p, bits):
+    n = p.bit_length()
+    while True:
+        value = 0
+        for _ in range(n):
+            value = (value << 1) | next(bits)
+        if value < p:
+            yield value
+
+
+def poly_mulmod(a, b, f, p):
+    """Product of a and b modulo the monic polynomial f, coefficients in
+    ascending order"""
+    res = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                res[i + j] += x * y
+    n = len(f) - 1
+    for i in range(len(res) - 1, n - 1, -1):
+        c = res[i] % p
+        if c:
+            for j in range(n + 1):
+                res[i - n + j] -= c * f[j]
+    return [c % p for c in res[:n]] + [0] * (n - len(res))
+
+
+def poly_compose(g, h, f, p):
+    """g(h) modulo f"""
+    res = [0] * (len(f) - 1)
+    for c in reversed(g):
+        res = poly_mulmod(res, h, f, p)
+        res[0] = (res[0] + c) % p
+    return res
+
+
+def poly_gcd_is_one(a, b, p):
+    def trim(a):
+        while a and a[-1] % p == 0:
+            a = a[:-1]
+        return a
+    a, b = trim(a), trim(b)
+    while b:
+        inv = pow(b[-1], -1, p)
+        a = a[:]
+        while len(a) >= len(b):
+            c = a[-1] * inv % p
+            shift = len(a) - len(b)
+            for i, x in enumerate(b):
+                a[shift + i] = (a[shift + i] - c * x) % p
+            a = trim(a)
+        a, b = b, a
+    return len(a) == 1
+
+
+def charpoly(M, p):
+    """Characteristic polynomial of M over F_p (monic, ascending order)
+    via reduction to Hessenberg form"""
+    n = len(M)
+    H = [[x % p for x in row] for row in M]
+    for m in range(1, n - 1):
+        i = next((i for i in range(m, n) if H[i][m - 1]), None)
+        if i is None:
+            continue
+        if i != m:
+            H[i], H[m] = H[m], H[i]
+            for row in H:
+                row[i], row[m] = row[m], row[i]
+        inv = pow(H[m][m - 1], -1, p)
+        for i in range(m + 1, n):
+            u = H[i][m - 1] * inv % p
+            if u:
+                for j in range(n):
+                    H[i][j] = (H[i][j] - u * H[m][j]) % p
+                for j in range(n):
+                    H[j][m] = (H[j][m] + u * H[j][i]) % p
+    polys = [[1]]
+    for m in range(n):
+        res = [0] + polys[m]
+        for k, c in enumerate(polys[m]):
+            res[k] = (res[k] - H[m][m] * c) % p
+        product = 1
+        for i in range(m - 1, -1, -1):
+            product = product * H[i + 1][i] % p
+            factor = product * H[i][m] % p
+            for k, c in enumerate(polys[i]):
+                res[k] = (res[k] - factor * c) % p
+        polys.append(res)
+    return polys[n]
+
+
+def prime_factors(n):
+    factors, q = [], 2
+    while q * q <= n:
+        if n % q == 0:
+            factors.append(q)
+            while n % q == 0:
+                n //= q
+        q += 1
+    return factors + ([n] if n > 1 else [])
+
+
+def check_minpoly_condition(M, p):
+    """Checks that the minimal polynomials of M, M^2, ..., M^(2t) are
+    irreducible of degree t, the condition the Poseidon2 reference imposes
+    on the internal matrix against invariant subspace trails.
+
+    If the characteristic polynomial f of M is irreducible with root x, the
+    condition holds for M^k iff x^k lies in no maximal subfield of
+    F_p[x]/f."""
+    t = len(M)
+    f = charpoly(M, p)
+    x = [0, 1] + [0] * (t - 2)
+    # Frobenius powers x^(p^d) by repeated composition with x^p
+    xp, base, e = [1] + [0] * (t - 1), x, p
+    while e:
+        if e & 1:
+            xp = poly_mulmod(xp, base, f, p)
+        base = poly_mulmod(base, base, f, p)
+        e >>= 1
+    frobenius = [x, xp]
+    for d in range(2, t + 1):
+        frobenius.append(poly_compose(frobenius[-1], xp, f, p))
+    # Rabin's irreducibility test
+    if frobenius[t] != x:
+        return False
+    subfields = [t // q for q in prime_factors(t)]
+    for d in subfields:
+        if not poly_gcd_is_one([(a - b) % p for a, b in zip(frobenius[d], x)], f, p):
+            return False
+    power = x
+    for k in range(1, 2 * t + 1):
+        if any(poly_compose(power, frobenius[d], f, p) == power for d in subfields):
+            return False
+        power = poly_mulmod(power, x, f, p)
+    return True
+
+
+def generate_parameters(p, t):
+    """Generates (Me, Mi, round_constants) for width t over F_p. Round
+    constants come from the Grain LFSR as in the Poseidon reference
+    implementation; partial round rows keep only their first entry. The
+    internal diagonal is drawn from the same stream until J + diag(Mi)
+    passes check_minpoly_condition."""
+    R_F, R_P = round_numbers(p, t, get_alpha(p))
+    elements = grain_field_elements(p, grain_bits(p, t, R_F, R_P))
+    round_constants = []
+    for r in range(R_F + R_P):
+        row = [next(elements) for _ in range(t)]
+        if R_F // 2 <= r < R_F // 2 + R_P:
+            row = row[:1] + [0] * (t - 1)
+        round_constants.append(row)
+    if t == 2:
+        Mi = [1, 2]
+    elif t == 3:
+        Mi = [1, 1, 2]
+    else:
+        while True:
+            Mi = [next(elements) for _ in range(t)]
+            M = [[1 + (Mi[i] if i == j else 0) for j in range(t)] for i in range(t)]
+            if check_minpoly_condition(M, p):
+                break
+    return external_matrix(t), Mi, round_constants
+
+
+# Parameters that are loaded rather than generated, matching Plonky3
+LOADED_PARAMETERS = {
+    ('koalabear', 16): {
+        'Mi': [479859441, 1064293388, 236801731, 325174860, 162067567, 64109119, 278581903, 683867015, 996448497, 1960361558, 1782740945, 415413203, 1649591051, 130819423, 547348826, 1386569643],
+        'round_constants': [
+            [2128964168, 288780357, 316938561, 2126233899, 426817493, 1714118888, 1045008582, 1738510837, 889721787, 8866516, 681576474, 419059826, 1596305521, 1583176088, 1584387047, 1529751136],
+            [1863858111, 1072044075, 517831365, 1464274176, 1138001621, 428001039, 245709561, 1641420379, 1365482496, 770454828, 693167409, 757905735, 136670447, 436275702, 525466355, 1559174242],
+            [1030087950, 869864998, 322787870, 267688717, 948964561, 740478015, 679816114, 113662466, 2066544572, 1744924186, 367094720, 1380455578, 1842483872, 416711434, 1342291586, 1692058446],
+            [1493348999, 1113949088, 210900530, 1071655077, 610242121, 1136339326, 2020858841, 1019840479, 678147278, 1678413261, 1361743414, 61132629, 1209546658, 64412292, 1936878279, 1980661727],
+            [1423960925, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [2101391318, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1915532054, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [275400051, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1168624859, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1141248885, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [356546469, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1165250474, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1320543726, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [932505663, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1204226364, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1452576828, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1774936729, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [926808140, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1184948056, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1186493834, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [843181003, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [185193011, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [452207447, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [510054082, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [1139268644, 630873441, 669538875, 462500858, 876500520, 1214043330, 383937013, 375087302, 636912601, 307200505, 390279673, 1999916485, 1518476730, 1606686591, 1410677749, 1581191572],
+            [1004269969, 143426723, 1747283099, 1016118214, 1749423722, 66331533, 1177761275, 1581069649, 1851371119, 852520128, 1499632627, 1820847538, 150757557, 884787840, 619710451, 1651711087],
+            [505263814, 212076987, 1482432120, 1458130652, 382871348, 417404007, 2066495280, 1996518884, 902934924, 582892981, 1337064375, 1199354861, 2102596038, 1533193853, 1436311464, 2012303432],
+            [839997195, 1225781098, 2011967775, 575084315, 1309329169, 786393545, 995788880, 1702925345, 1444525226, 908073383, 1811535085, 1531002367, 1635653662, 1585100155, 867006515, 879151050]
+        ],
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def instance_parameters(field, t):
+    """Returns (p, t, Me, Mi, round_constants) for a registered field and
+    width, from the loaded parameters, then the on-disk cache, and only
+    generates them if neither has an entry"""
+    p = FIELDS[field]
+    if (field, t) in LOADED_PARAMETERS:
+        loaded = LOADED_PARAMETERS[(field, t)]
+        return p, t, external_matrix(t), loaded['Mi'], loaded['round_constants']
+    cache = load_cache()
+    cache_key = 'instance,%s,%d' % (field, t)
+    if cache_key not in cache:
+        cache[cache_key] = generate_parameters(p, t)
+        store_cache(cache)
+    Me, Mi, round_constants = cache[cache_key]
+    return p, t, Me, Mi, round_constants
@@ -0,0 +1,161 @@
+"""Cleartext Poseidon2 over the same parameters as poseidon2.py, evaluating
+batches of states at once with NumPy. Used to compute expected chain ends
+(e.g. OTS public keys) and to check MPC outputs in bulk.
+
+    python3 poseidon2_ref.py [field] [t] [chainlen] [count] [seed]
+
+prints test vectors for hash_chain as JSON."""
+
+import json
+import random
+import sys
+
+import numpy as np
+
+from poseidon2_params import get_alpha, round_numbers, instance_parameters
+
+
+class Poseidon2Ref:
+    """States are arrays of shape (N, t). Fields below 2^32 use uint64, where
+    every product of two reduced elements fits; larger fields fall back to
+    object arrays of Python integers."""
+
+    def __init__(self, p, t, Me, Mi, round_constants):
+        self.p = p
+        self.t = t
+        self.alpha = get_alpha(p)
+        self.Re, self.Ri = round_numbers(p, t, self.alpha, 128, True)
+        self.dtype = np.uint64 if p < 2**32 else object
+        # Me is applied as one matrix product, so its entries must be small
+        # enough that t of them times p do not overflow
+        assert self.dtype is object or max(map(max, Me)) * t * p < 2**64
+        self.Me_T = self.array(Me).T.copy()
+        self.Mi = self.array(Mi)
+        self.round_constants = self.array(round_constants)
+
+    @classmethod
+    def instance(cls, field='koalabear', t=16):
+        return cls(*instance_parameters(field, t))
+
+    def array(self, values):
+        if self.dtype is object:
+            return np.array([[int(x) for x in row] for row in values]
+                            if np.ndim(values) == 2 else [int(x) for x in values],
+                            dtype=object) % self.p
+        return np.array(values, dtype=np.uint64) % np.uint64(self.p)
+
+    def states(self, states):
+        """Converts states to a 2-D array, accepting a single state too"""
+        states = self.array(states)
+        assert states.shape[-1] == self.t, ('Wrong state width', states.shape)
+        return states.reshape(-1, self.t)
+
+    def sbox(self, x):
+        p = self.p
+        result, base, e = None, x, self.alpha
+        while e:
+            if e & 1:
+                result = base if result is None else result * base % p
+            e >>= 1
+            if e:
+                base = base * base % p
+        return result
+
+    def linear_e(self, x):
+        return x @ self.Me_T % self.p
+
+    def linear_i(self, x):
+        sum_ = x.sum(axis=1) % self.p
+        return (sum_[:, None] + x * self.Mi % self.p) % self.p
+
+    def permute(self, x):
+        p = self.p
+        rc = self.round_constants
+        x = self.linear_e(x)
+        for r in range(self.Re // 2):
+            x = self.linear_e(self.sbox((x + rc[r]) % p))
+        for r in range(self.Re // 2, self.Re // 2 + self.Ri):
+            x = x.copy()
+            x[:, 0] = self.sbox((x[:, 0] + rc[r][0]) % p)
+            x = self.linear_i(x)
+        for r in range(self.Re // 2 + self.Ri, self.Re + self.Ri):
+            x = self.linear_e(self.sbox((x + rc[r]) % p))
+        return x
+
+    def permutation(self, states):
+        return self.permute(self.states(states))
+
+    def compress_hash(self, states):
+        x = self.states(states)
+        return (self.permute(x) + x) % self.p
+
+    def hash_chain(self, states, chainlen):
+        x = self.states(states)
+        for _ in range(chainlen):
+            x = (self.permute(x) + x) % self.p
+        return x
+
+    def ots(self, states, chainlens):
+        """Advances row i by chainlens[i] steps, or every row by the same
+        number of steps if chainlens is an integer"""
+        x = self.states(states)
+        if isinstance(chainlens, int):
+            return self.hash_chain(x, chainlens)
+        chainlens = np.asarray(chainlens)
+        assert chainlens.shape == (len(x),)
+        for step in range(int(chainlens.max(initial=0))):
+            active = np.nonzero(chainlens > step)[0]
+            x[active] = self.compress_hash(x[active])
+        return x
+
+    def sponge_hash(self, messages, output_length=None, rate=None):
+        """Sponge hash of the rows of messages (shape (N, L)), as
+        Poseidon2.sponge_hash_batch"""
+        rate = rate or self.t - self.t // 2
+        output_length = output_length or rate
+        messages = self.array(messages)
+        if messages.ndim == 1:
+            messages = messages[None, :]
+        n, length = messages.shape
+        blocks = length // rate + 1
+        padded = np.zeros((n, blocks * rate), dtype=self.dtype)
+        padded[:, :length] = messages
+        padded[:, length] = 1
+        x = np.zeros((n, self.t), dtype=self.dtype)
+        for b in range(blocks):
+            x[:, :rate] = (x[:, :rate] + padded[:, b * rate:(b + 1) * rate]) % self.p
+            x = self.permute(x)
+        digests = []
+        for k in range(output_length):
+            if k and k % rate == 0:
+                x = self.permute(x)
+            digests.append(x[:, k % rate])
+        return np.stack(digests, axis=1)
+
+    def merkle_levels(self, leaves):
+        """Levels of the Merkle tree over the rows of leaves (shape (n, t/2),
+        n a power of two) as MerkleTree, from the leaves to the root"""
+        levels = [self.array(leaves)]
+        while len(levels[-1]) > 1:
+            children = levels[-1].reshape(-1, self.t)
+            levels.append(self.compress_hash(children)[:, :self.t // 2])
+        return levels
+
+    def test_vectors(self, chainlen, count, seed=0):
+        rng = random.Random(seed)
+        inputs = [[rng.randrange(self.p) for _ in range(self.t)] for _ in range(count)]
+        outputs = self.hash_chain(inputs, chainlen)
+        return {
+            'p': self.p, 't': self.t, 'chainlen': chainlen,
+            'vectors': [{'input': x, 'output': [int(y) for y in out]}
+                        for x, out in zip(inputs, outputs)],
+        }
+
+
+if __name__ == '__main__':
+    field = sys.argv[1] if len(sys.argv) > 1 else 'koalabear'
+    t = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    chainlen = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    count = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    print(json.dumps(Poseidon2Ref.instance(field, t).test_vectors(chainlen, count, seed), indent=2))
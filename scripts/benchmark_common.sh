@@ -3,6 +3,8 @@
 
 set -e
 
+BENCHMARK_COMMON="$(realpath "${BASH_SOURCE[0]}")"
+
 # Common configuration
 NUM_PARTIES=3
 KOALABEAR=2130706433
@@ -10,8 +12,32 @@ LOG_KOALABEAR=31
 NETWORK_DELAYS=(1 10 100)
 THROUGHPUT="1000Mbps"
 PROTOCOLS=(mama mascot atlas mal-shamir)
-RESULTS_DIR="/root/results"
-TIMESTAMP=$(date +%Y%m%d_%H%M%S)
+RESULTS_DIR="${RESULTS_DIR:-/root/results}"
+TIMESTAMP="${TIMESTAMP:-$(date +%Y%m%d_%H%M%S)}"
+
+# Compile stamps, and logs superseded by a change of sources or MP-SPDZ
+CACHE_DIR="${RESULTS_DIR}/.cache"
+STALE_DIR="${RESULTS_DIR}/stale"
+
+# Row selection, as comma-separated lists (empty selects everything):
+#   BENCH_PARAMS="68 4 1,68 4 2" BENCH_PROTOCOLS=mama,atlas BENCH_DELAYS=1,10
+# FORCE=1 re-runs cells that already have a valid log
+BENCH_PARAMS="${BENCH_PARAMS:-}"
+BENCH_PROTOCOLS="${BENCH_PROTOCOLS:-}"
+BENCH_DELAYS="${BENCH_DELAYS:-}"
+FORCE="${FORCE:-0}"
+
+# PARALLEL=k runs up to k cells at once, each in its own network namespace
+# with its own netem settings and pinned to CORES_PER_CELL cores. Slots are
+# limited by the number of cores.
+PARALLEL="${PARALLEL:-1}"
+CORES_PER_CELL="${CORES_PER_CELL:-${NUM_PARTIES}}"
+SLOT_PIDS=()
+
+# Every cell is run WARMUP times without keeping the logs, then REPETITIONS
+# times, each with its own log, which parse_logs.py aggregates
+REPETITIONS="${REPETITIONS:-1}"
+WARMUP="${WARMUP:-0}"
 
 # Function to set up network delay using tc
 setup_network() {
@@ -39,14 +65,91 @@ cleanup_network() {
     fi
 }
 
+# Function to kill all processes left in a network namespace and remove it
+remove_namespace() {
+    local ns=$1
+
+    ip netns pids "${ns}" 2>/dev/null | xargs -r kill 2>/dev/null || true
+    ip netns del "${ns}" 2>/dev/null || true
+}
+
+# Function to stop parallel experiments and remove their namespaces
+cleanup_namespaces() {
+    for pid in "${SLOT_PIDS[@]}"; do
+        kill "${pid}" 2>/dev/null || true
+    done
+    # Killing the slots leaves their parties running in the namespaces
+    for ns in $(ip netns list 2>/dev/null | grep -o '^mpc_[0-9a-f]*'); do
+        remove_namespace "${ns}"
+    done
+}
+
+# Function to run a single experiment in a fresh network namespace, whose
+# loopback carries the delay, with all parties pinned to the given cores.
+# The cell is not run if the namespace or its delay cannot be set up, and
+# the errors of failed runs are printed with the cell they belong to.
+run_isolated_experiment() {
+    local protocol=$1
+    local delay=$2
+    local compiled_program_name=$3
+    local key=$4
+    local cores=$5
+
+    local cell="${compiled_program_name} with ${protocol}, delay ${delay}ms"
+    local ns="mpc_${key}"
+    if ! ip netns add "${ns}" || ! ip -n "${ns}" link set lo up || \
+       ! ip netns exec "${ns}" tc qdisc add dev lo root netem delay ${delay}ms rate ${THROUGHPUT}; then
+        echo "Error: failed to set up network namespace ${ns}, skipping ${cell}" >&2
+        remove_namespace "${ns}"
+        return 1
+    fi
+
+    local errors
+    errors=$(ip netns exec "${ns}" env RESULTS_DIR="${RESULTS_DIR}" TIMESTAMP="${TIMESTAMP}" \
+        REPETITIONS="${REPETITIONS}" WARMUP="${WARMUP}" FORCE="${FORCE}" \
+        taskset -c "${cores}" bash -c "source '${BENCHMARK_COMMON}'; \
+        run_cell ${protocol} ${delay} true ${compiled_program_name} ${key}" 2>&1 > /dev/null) || true
+    if [ -n "${errors}" ]; then
+        echo "Errors in ${cell}:" >&2
+        echo "${errors}" >&2
+    fi
+
+    remove_namespace "${ns}"
+}
+
+# Function to start an isolated experiment in the first free slot, waiting
+# for one if all are busy
+run_parallel_experiment() {
+    local slots=$(( $(nproc) / CORES_PER_CELL ))
+    [ "${slots}" -gt "${PARALLEL}" ] && slots=${PARALLEL}
+    [ "${slots}" -lt 1 ] && slots=1
+
+    while true; do
+        for ((slot = 0; slot < slots; slot++)); do
+            local pid=${SLOT_PIDS[$slot]:-}
+            if [ -z "${pid}" ] || ! kill -0 "${pid}" 2>/dev/null; then
+                local first=$((slot * CORES_PER_CELL))
+                local cores="${first}-$((first + CORES_PER_CELL - 1))"
+                echo "Starting ${3} with ${1}, delay ${2}ms in slot ${slot} (cores ${cores})"
+                run_isolated_experiment "$@" "${cores}" &
+                SLOT_PIDS[$slot]=$!
+                return 0
+            fi
+        done
+        sleep 1
+    done
+}
+
 # Function to compile and return the generated program name
 compile_program() {
     local program_name=$1
     shift
     local params="$@"
         
-    # Compile and capture output to find the generated program name
-    local compile_output=$(./compile.py ${program_name} ${params} -F ${LOG_KOALABEAR} 2>&1 | tee /dev/tty)
+    # Compile and capture output to find the generated program name.
+    # Poseidon2 only compiles for the prime of its field, which the parties
+    # use as well
+    local compile_output=$(./compile.py ${program_name} ${params} -P ${KOALABEAR} 2>&1 | tee /dev/tty)
     
     # Extract the compiled program name from compiler output
     local compiled_name=$(echo "$compile_output" | grep -oP "Writing to Programs/Schedules/\K[^/\s]+(?=\.sch)" | head -1)
@@ -54,12 +157,95 @@ compile_program() {
     echo "$compiled_name"
 }
 
+# Function to check whether a value is selected by a comma-separated list
+selected() {
+    local value=$1
+    local list=$2
+
+    [ -z "$list" ] && return 0
+    local items
+    IFS=',' read -ra items <<< "$list"
+    for item in "${items[@]}"; do
+        [ "$item" = "$value" ] && return 0
+    done
+    return 1
+}
+
+# Function to identify the MP-SPDZ build
+mpspdz_version() {
+    git describe --tags --always --dirty 2>/dev/null || echo "unknown"
+}
+
+# Function to hash the sources a program is compiled from
+source_hash() {
+    local program_name=$1
+
+    cat Programs/Source/${program_name}.mpc Compiler/poseidon2*.py 2>/dev/null | sha256sum | cut -c1-16
+}
+
+# Function to compile unless the schedule of the same sources and
+# parameters exists, and return the compiled program name
+compile_cached() {
+    local program_name=$1
+    shift
+    local params="$@"
+
+    mkdir -p "${CACHE_DIR}"
+    local stamp="${CACHE_DIR}/compile_$(echo "${program_name} ${params} -P ${KOALABEAR}" | sha256sum | cut -c1-16)"
+    # Schedules and bytecode of another compiler version are not reused
+    local hash=$(echo "$(mpspdz_version)|$(source_hash "${program_name}")" | sha256sum | cut -c1-16)
+
+    if [ -f "${stamp}" ]; then
+        local cached_hash cached_name
+        read -r cached_hash cached_name < "${stamp}"
+        if [ "${cached_hash}" = "${hash}" ] && [ -f "Programs/Schedules/${cached_name}.sch" ] && \
+           [ -f "Programs/Bytecode/${cached_name}-0.bc" ]; then
+            echo "Reusing compiled ${cached_name}" >&2
+            echo "${cached_name}"
+            return 0
+        fi
+    fi
+
+    local compiled_name=$(compile_program "${program_name}" ${params})
+    echo "${hash} ${compiled_name}" > "${stamp}"
+    echo "${compiled_name}"
+}
+
+# Function to derive the cache key of a cell from everything its result
+# depends on
+cell_key() {
+    local program_name=$1
+    local compiled_name=$2
+    local protocol=$3
+    local delay=$4
+
+    echo "${compiled_name}|${protocol}|${delay}|${NUM_PARTIES}|${THROUGHPUT}|$(mpspdz_version)|$(source_hash "${program_name}")" | sha256sum | cut -c1-12
+}
+
+# Function to check that a log contains the results of a complete run
+valid_log() {
+    [ -f "$1" ] && grep -q "on the online phase" "$1"
+}
+
+# Function to print the party options of a protocol
+party_options() {
+    local protocol=$1
+
+    if [ "$protocol" = "atlas" ] || [ "$protocol" = "mama" ]; then
+        echo "-N ${NUM_PARTIES} -P ${KOALABEAR}"
+    else
+        echo "-N ${NUM_PARTIES} -P ${KOALABEAR} -S ${LOG_KOALABEAR}"
+    fi
+}
+
 # Function to run a single experiment
 run_single_experiment() {
     local protocol=$1
     local delay=$2
     local network_enabled=$3
     local compiled_program_name=$4  # This is now the actual compiled name
+    local key=${5:-${TIMESTAMP}}
+    local run=${6:-1}
 
     local delay_label="${delay}ms"
     if [ "$network_enabled" = false ]; then
@@ -74,20 +260,73 @@ run_single_experiment() {
     echo "  Throughput: ${THROUGHPUT}"
     echo "=========================================="
 
-    local output_file="${RESULTS_DIR}/${compiled_program_name}_${protocol}_${delay_label}_${TIMESTAMP}.log"
+    local output_file="${RESULTS_DIR}/${compiled_program_name}_${protocol}_${delay_label}_${key}_run${run}.log"
 
     echo "Executing: ./Scripts/${protocol}.sh ${compiled_program_name}"
 
-    if [ "$protocol" = "atlas" ] || [ "$protocol" = "mama" ]; then
-        ./Scripts/${protocol}.sh ${compiled_program_name} -N ${NUM_PARTIES} -P ${KOALABEAR} -v 2>&1 | tee "${output_file}"
-    else
-        ./Scripts/${protocol}.sh ${compiled_program_name} -N ${NUM_PARTIES} -P ${KOALABEAR} -S ${LOG_KOALABEAR} -v 2>&1 | tee "${output_file}"
+    # The log only gets its final name once the run is complete, so an
+    # interrupted sweep never leaves a log that looks valid
+    ./Scripts/${protocol}.sh ${compiled_program_name} $(party_options ${protocol}) -v 2>&1 | tee "${output_file}.partial"
+
+    if ! valid_log "${output_file}.partial"; then
+        echo "Run failed, log kept in ${output_file}.partial:" >&2
+        tail -n 20 "${output_file}.partial" >&2
+        return 0
     fi
 
+    # Logs of the same cell under an earlier key are moved away so that
+    # parse_logs.py only sees the current ones
+    mkdir -p "${STALE_DIR}"
+    for old in "${RESULTS_DIR}/${compiled_program_name}_${protocol}_${delay_label}_"*.log; do
+        if [ -f "${old}" ] && [[ "${old}" != *"_${key}_run"* ]]; then
+            mv "${old}" "${STALE_DIR}/"
+        fi
+    done
+    mv "${output_file}.partial" "${output_file}"
+
     echo "Results saved to: ${output_file}"
     echo ""
 }
 
+# Function to check that a cell has a valid log for every repetition
+cell_complete() {
+    local compiled_program_name=$1
+    local protocol=$2
+    local key=$3
+
+    for ((run = 1; run <= REPETITIONS; run++)); do
+        local log=$(ls "${RESULTS_DIR}/${compiled_program_name}_${protocol}_"*"_${key}_run${run}.log" 2>/dev/null | head -1)
+        [ -n "${log}" ] && valid_log "${log}" || return 1
+    done
+    return 0
+}
+
+# Function to run the warm-up runs and the missing repetitions of a cell
+run_cell() {
+    local protocol=$1
+    local delay=$2
+    local network_enabled=$3
+    local compiled_program_name=$4
+    local key=$5
+
+    for ((run = 1; run <= WARMUP; run++)); do
+        echo "Warm-up run ${run}/${WARMUP}"
+        run_single_experiment "$@" "warmup" > /dev/null
+        rm -f "${RESULTS_DIR}/${compiled_program_name}_${protocol}_"*"_${key}_runwarmup.log"*
+        sleep 2
+    done
+
+    for ((run = 1; run <= REPETITIONS; run++)); do
+        local log=$(ls "${RESULTS_DIR}/${compiled_program_name}_${protocol}_"*"_${key}_run${run}.log" 2>/dev/null | head -1)
+        if [ "${FORCE}" != 1 ] && [ -n "${log}" ] && valid_log "${log}"; then
+            continue
+        fi
+        run_single_experiment "$@" "${run}"
+        [ "${run}" -lt "${REPETITIONS}" ] && sleep 2
+    done
+    return 0
+}
+
 # Function to run benchmark suite
 run_benchmark_suite() {
     local program_name=$1
@@ -106,20 +345,36 @@ run_benchmark_suite() {
     echo ""
 
     for params in "${params_array[@]}"; do
+        selected "${params}" "${BENCH_PARAMS}" || continue
+
         # Compile and get the actual compiled program name
         echo "Compiling ${program_name}.mpc with parameters: ${params}..."
-        compiled_name=$(compile_program "${program_name}" ${params})
+        compiled_name=$(compile_cached "${program_name}" ${params})
         echo ""
 
         for protocol in "${PROTOCOLS[@]}"; do
+            selected "${protocol}" "${BENCH_PROTOCOLS}" || continue
             for delay in "${NETWORK_DELAYS[@]}"; do
+                selected "${delay}" "${BENCH_DELAYS}" || continue
+
+                key=$(cell_key "${program_name}" "${compiled_name}" "${protocol}" "${delay}")
+                if [ "${FORCE}" != 1 ] && cell_complete "${compiled_name}" "${protocol}" "${key}"; then
+                    echo "Skipping ${compiled_name} ${protocol} ${delay}ms, results are cached"
+                    continue
+                fi
+
+                if [ "${PARALLEL}" -gt 1 ]; then
+                    run_parallel_experiment "${protocol}" "${delay}" "${compiled_name}" "${key}"
+                    continue
+                fi
+
                 network_enabled=false
                 if setup_network ${delay}; then
                     network_enabled=true
                 fi
 
                 # Pass the compiled name, not the original source name
-                run_single_experiment "${protocol}" "${delay}" "${network_enabled}" "${compiled_name}"
+                run_cell "${protocol}" "${delay}" "${network_enabled}" "${compiled_name}" "${key}"
 
                 if [ "$network_enabled" = true ]; then
                     cleanup_network
@@ -130,11 +385,14 @@ run_benchmark_suite() {
         done
     done
 
+    # Wait for the experiments still running in parallel slots
+    wait
+
     echo "======================================"
     echo "All experiments complete!"
     echo "Results are saved in: ${RESULTS_DIR}"
     echo "======================================"
     echo ""
     echo "Result files:"
-    ls -lh ${RESULTS_DIR}/*${TIMESTAMP}.log 2>/dev/null || echo "No result files found."
+    ls -lh ${RESULTS_DIR}/${program_name}-*.log 2>/dev/null || echo "No result files found."
 }
\ No newline at end of file
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Static cost model for the Poseidon2 benchmark programs. Predicts online
+rounds, preprocessing and data volume from the Poseidon2 parameters without
+compiling or running anything, and fits the per-protocol constants to logs
+read by parse_logs.py.
+
+Usage: python cost_model.py <program> <args...> [--constants constants.json]
+       python cost_model.py --calibrate <log_directory> [--output constants.json]
+
+The program arguments are those passed to compile.py, e.g.
+  python cost_model.py poseidon2_chains 64 sbox=square_multiply
+  python cost_model.py leansig 48 10 326 powers field=babybear t=24
+  python cost_model.py poseidon2_chains 64 partial=paired
+  python cost_model.py leansig_keygen 10 48 10
+"""
+
+import json
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# poseidon2_params is found next to this repository's programs, or in the
+# compiler directory of the image
+for path in (Path(__file__).resolve().parent.parent / "programs", Path("/root/MP-SPDZ/Compiler")):
+    if (path / "poseidon2_params.py").exists():
+        sys.path.insert(0, str(path))
+        break
+from poseidon2_params import FIELDS, get_alpha, round_numbers, keygen_permutations, \
+    sponge_permutations
+
+from parse_logs import CONFIGS, DELAY_TO_D, parse_log
+
+# Rough per-protocol constants, to be replaced by --calibrate:
+# online MB per opened field element, offline MB per preprocessed item,
+# online seconds per round and ms of delay, online seconds per MB
+DEFAULT_CONSTANTS = {
+    "MAMA": {"on_mb_per_open": 3.2e-5, "off_mb_per_prec": 2.0e-2, "s_per_round_ms": 2.0e-3, "s_per_mb": 8.0e-3},
+    "MASCOT": {"on_mb_per_open": 3.2e-5, "off_mb_per_prec": 1.0e-2, "s_per_round_ms": 2.0e-3, "s_per_mb": 8.0e-3},
+    "ATLAS": {"on_mb_per_open": 1.6e-5, "off_mb_per_prec": 1.0e-4, "s_per_round_ms": 2.0e-3, "s_per_mb": 8.0e-3},
+    "Mal. Shamir": {"on_mb_per_open": 3.2e-5, "off_mb_per_prec": 2.0e-4, "s_per_round_ms": 2.0e-3, "s_per_mb": 8.0e-3},
+}
+
+
+def powers_cost(alpha: int, known: Tuple[int, ...]) -> Tuple[int, int]:
+    """Number of multiplications and multiplicative depth of computing
+    x^alpha from the given powers, following extend_powers in poseidon2.py"""
+    depth = {e: 0 for e in known}
+
+    def extend(e):
+        if e not in depth:
+            a = 1 << ((e - 1).bit_length() - 1)
+            extend(a)
+            extend(e - a)
+            depth[e] = max(depth[a], depth[e - a]) + 1
+        return depth[e]
+
+    for e in range(1, alpha + 1):
+        extend(e)
+    return len(depth) - len(known), extend(alpha)
+
+
+def pair_cost(alpha: int) -> Tuple[int, int]:
+    """Number of multiplications and multiplicative depth of the monomials
+    r^m r'^k of a pair of partial rounds, following random_pair_monomials
+    in poseidon2.py"""
+    r_mults, r_depth = powers_cost(alpha**2, (1, 2))
+    s_mults, _ = powers_cost(alpha, (1, 2))
+    cross = sum(alpha * (alpha - k) for k in range(1, alpha + 1))
+    return r_mults + s_mults + cross, r_depth + 1
+
+
+@dataclass
+class Estimate:
+    """Online rounds and openings are those of the whole program, which
+    MP-SPDZ reports as its online phase. With 'powers', the pool is
+    generated in the same program, before timer 1, and timed_rounds and
+    timed_opens count the timed section alone."""
+    program: str
+    permutations: int
+    depth: int
+    sboxes: int
+    online_rounds: int
+    triples: int
+    squares: int
+    opens: int
+    timed_rounds: int
+    timed_opens: int
+
+    @property
+    def prec(self) -> int:
+        return self.triples + self.squares
+
+
+def estimate(program: str, args: List[str]) -> Estimate:
+    """Counts the work of one run of a benchmark program with the given
+    compile arguments"""
+    options = dict(arg.split("=", 1) for arg in args if "=" in arg)
+    numbers = [int(arg) for arg in args if arg.isdigit()]
+    field = options.get("field", "koalabear")
+    t = int(options.get("t", 16))
+    sbox = options.get("sbox", "masked")
+    partial = options.get("partial", "single")
+    # 'cubes' is the earlier name of 'powers'
+    pool = "powers" in args or "cubes" in args
+
+    p = FIELDS[field]
+    alpha = get_alpha(p)
+    Re, Ri = round_numbers(p, t, alpha, 128, True)
+
+    if program == "poseidon2_chains":
+        ell = numbers[0] if numbers else 1
+        permutations, depth = ell, ell
+    elif program == "leansig":
+        chunks, w, tsw = numbers
+        if "runtime" in args:
+            # Every chunk is advanced for the longest possible chain
+            permutations, depth = chunks * (w - 1), w - 1
+        else:
+            permutations, depth = tsw, min(w - 1, tsw)
+    elif program in ("leansig_prec", "leansig_pool"):
+        chunks, w, nsig = numbers
+        permutations, depth = nsig * chunks * (w - 1), w - 1
+    elif program == "leansig_keygen":
+        height, chunks, w = numbers
+        # Chains, then sponge hashes of t/2 elements per chain end, then one
+        # batch per tree level
+        permutations = keygen_permutations(t, height, chunks, w)
+        depth = w - 1 + sponge_permutations(t, chunks * (t // 2), t // 2) + height
+    else:
+        raise ValueError(f"Unknown program {program}")
+
+    sboxes = permutations * (t * Re + Ri)
+    # Paired partial rounds open the S-box inputs of two rounds at once
+    paired = sbox == "masked" and partial == "paired"
+    pairs = permutations * (Ri // 2) if paired else 0
+    layers = depth * (Re + Ri - (Ri // 2 if paired else 0))
+    if sbox == "masked":
+        # One opening of x - r per S-box, powers of r from a random square
+        mults, power_depth = powers_cost(alpha, (1, 2))
+        pair_mults, pair_depth = pair_cost(alpha)
+        singles = sboxes - 2 * pairs
+        squares, triples = sboxes, singles * mults + pairs * pair_mults
+        # Generating powers does not depend on the state, so it only adds
+        # rounds once, before the first layer. With a pool, it happens in
+        # the same program but before the timer.
+        if pairs:
+            power_depth = max(power_depth, pair_depth)
+        opens = sboxes + 2 * triples
+        online_rounds = layers + power_depth
+        timed_opens = sboxes if pool else opens
+        timed_rounds = layers if pool else online_rounds
+    else:
+        mults, power_depth = powers_cost(alpha, (1,))
+        squares, triples = 0, sboxes * mults
+        opens = 2 * triples
+        online_rounds = layers * power_depth
+        timed_opens, timed_rounds = opens, online_rounds
+    return Estimate(program, permutations, depth, sboxes, online_rounds, triples, squares, opens,
+                    timed_rounds, timed_opens)
+
+
+def predict(est: Estimate, constants: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Per-protocol data volume and online time for each delay"""
+    predictions = {}
+    for protocol, c in constants.items():
+        on_data = est.opens * c["on_mb_per_open"]
+        prediction = {
+            "off_data": est.prec * c["off_mb_per_prec"],
+            "on_data": on_data,
+        }
+        for delay, d in DELAY_TO_D.items():
+            prediction[f"on_time_{delay}"] = est.online_rounds * d * c["s_per_round_ms"] + on_data * c["s_per_mb"]
+        predictions[protocol] = prediction
+    return predictions
+
+
+def program_args(filepath: Path, prefix: str) -> List[str]:
+    """Recovers the compile arguments from the compiled program name at the
+    start of a log file name (see run_single_experiment)"""
+    match = re.match(r"(.*)_[a-z-]+_(?:\d+ms|no_delay)_(?:\d{8}_\d{6}|[0-9a-f]+_run\d+)\.log$", filepath.name)
+    compiled = match.group(1) if match else filepath.stem
+    return compiled[len(prefix) + 1:].split("-") if compiled.startswith(prefix + "-") else []
+
+
+def calibrate(log_dir: Path) -> Dict[str, Dict[str, float]]:
+    """Fits the per-protocol constants to all parsable logs in log_dir by
+    least squares"""
+    import numpy as np
+
+    samples = {}
+    # Longer prefixes first, so that leansig_prec logs are not read as leansig
+    for prefix in sorted(CONFIGS, key=len, reverse=True):
+        for log_file in sorted(log_dir.glob(f"*{prefix}-*.log")):
+            if prefix == "leansig" and "leansig_prec" in log_file.name:
+                continue
+            runs = parse_log(log_file, prefix)
+            if not runs:
+                continue
+            est = estimate(prefix, program_args(log_file, prefix))
+            samples.setdefault(runs[0].protocol, []).extend((r, est) for r in runs)
+
+    constants = {}
+    for protocol, pairs in samples.items():
+        c = dict(DEFAULT_CONSTANTS.get(protocol, DEFAULT_CONSTANTS["MASCOT"]))
+        opens = np.array([e.opens for _, e in pairs], dtype=float)
+        prec = np.array([e.prec for _, e in pairs], dtype=float)
+        on_data = np.array([r.on_data for r, _ in pairs])
+        off_data = np.array([r.off_data for r, _ in pairs])
+        if opens.any():
+            c["on_mb_per_open"] = float(opens @ on_data / (opens @ opens))
+        if prec.any():
+            c["off_mb_per_prec"] = float(prec @ off_data / (prec @ prec))
+        # on_time = s_per_round_ms * rounds * d + s_per_mb * on_data
+        A = np.array([[r.com_rounds * r.d, r.on_data] for r, _ in pairs], dtype=float)
+        b = np.array([r.on_time for r, _ in pairs])
+        if len(pairs) >= 2 and np.linalg.matrix_rank(A) == 2:
+            x = np.linalg.lstsq(A, b, rcond=None)[0]
+            c["s_per_round_ms"], c["s_per_mb"] = float(x[0]), float(x[1])
+        c["samples"] = len(pairs)
+        constants[protocol] = c
+        print(f"✓ {protocol}: {len(pairs)} logs")
+    return constants
+
+
+def format_estimate(est: Estimate, predictions: Dict[str, Dict[str, float]]) -> str:
+    lines = [
+        f"Permutations: {est.permutations} ({est.depth} sequential)",
+        f"S-boxes: {est.sboxes}",
+        f"Online rounds: {est.online_rounds} ({est.timed_rounds} timed)",
+        f"Preprocessing: {est.triples} triples, {est.squares} squares",
+        f"Opened elements: {est.opens} ({est.timed_opens} timed)",
+        "",
+        f"{'Protocol':<13} {'Off. data(MB)':<14} {'On. data(MB)':<13} On. time (s) d=1 / d=10 / d=100",
+    ]
+    for protocol, p in predictions.items():
+        times = " / ".join(f"{p[f'on_time_{delay}']:.2f}" for delay in DELAY_TO_D)
+        lines.append(f"{protocol:<13} {p['off_data']:<14.2f} {p['on_data']:<13.2f} {times}")
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python cost_model.py <program> <args...> [--constants constants.json]")
+        print("       python cost_model.py --calibrate <log_directory> [--output constants.json]")
+        print("\nExamples:")
+        print("  python cost_model.py poseidon2_chains 64")
+        print("  python cost_model.py leansig 48 10 326 sbox=square_multiply")
+        print("  python cost_model.py --calibrate ./results --output constants.json")
+        sys.exit(1)
+
+    if sys.argv[1] == "--calibrate":
+        if len(sys.argv) < 3:
+            print("Error: --calibrate needs a log directory")
+            sys.exit(1)
+        output_file = None
+        if "--output" in sys.argv[3:]:
+            output_file = sys.argv[sys.argv.index("--output") + 1]
+        constants = calibrate(Path(sys.argv[2]))
+        if not constants:
+            print("No valid results found")
+            sys.exit(1)
+        text = json.dumps(constants, indent=2)
+        if output_file:
+            with open(output_file, "w") as f:
+                f.write(text)
+            print(f"\nConstants written to {output_file}")
+        else:
+            print(text)
+        return
+
+    args = sys.argv[2:]
+    constants = DEFAULT_CONSTANTS
+    if "--constants" in args:
+        i = args.index("--constants")
+        with open(args[i + 1]) as f:
+            constants = json.load(f)
+        args = args[:i] + args[i + 2:]
+    est = estimate(sys.argv[1], args)
+    print(format_estimate(est, predict(est, constants)))
+
+
+if __name__ == "__main__":
+    main()
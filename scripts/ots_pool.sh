@@ -0,0 +1,121 @@
+#!/bin/bash
+# Pool of precomputed LeanSig one-time keys (see OTSPool in poseidon2.py).
+# Refills compute whole chains while the signer is idle and store their
+# shares in Persistence/, signing only reads the positions it needs.
+#
+#   ots_pool.sh init                empty the pool
+#   ots_pool.sh refill              add POOL_BATCH keys if fewer than POOL_LOW are unused
+#   ots_pool.sh refill-loop         refill every POOL_INTERVAL seconds, e.g. in the background
+#   ots_pool.sh sign <digits...>    sign an encoded message with the next unused key
+#   ots_pool.sh status
+
+source "$(dirname "$0")/benchmark_common.sh"
+
+POOL_DIR="${POOL_DIR:-/root/pool}"
+# LeanSig chunks and w, and further compile arguments such as 'powers'
+POOL_PARAMS="${POOL_PARAMS:-68 4}"
+POOL_OPTIONS="${POOL_OPTIONS:-}"
+POOL_BATCH="${POOL_BATCH:-16}"
+POOL_LOW="${POOL_LOW:-32}"
+POOL_INTERVAL="${POOL_INTERVAL:-10}"
+POOL_PROTOCOL="${POOL_PROTOCOL:-mascot}"
+# Refills and signatures run at the same time, so they use their own ports
+# and input files
+REFILL_PORT="${REFILL_PORT:-15000}"
+SIGN_PORT="${SIGN_PORT:-14000}"
+
+mkdir -p "${POOL_DIR}/logs"
+
+# Function to read a pool counter, the number of keys produced or consumed
+read_counter() {
+    cat "${POOL_DIR}/$1" 2>/dev/null || echo 0
+}
+
+# Function to run a pool program with the given inputs of party 0
+run_pool_program() {
+    local compiled_program_name=$1
+    local port=$2
+    local input=$3
+    shift 3
+
+    echo "$@" > "Player-Data/${input}-P0-0"
+    local log="${POOL_DIR}/logs/${compiled_program_name}_$(date +%Y%m%d_%H%M%S_%N).log"
+    ./Scripts/${POOL_PROTOCOL}.sh ${compiled_program_name} $(party_options ${POOL_PROTOCOL}) \
+        -pn ${port} -IF "Player-Data/${input}" -v > "${log}" 2>&1
+    valid_log "${log}" && echo "${log}"
+}
+
+# Function to add a batch of keys unless enough are unused
+refill() {
+    # Only one refill at a time, as keys are appended in order
+    exec 8> "${POOL_DIR}/refill.lock"
+    flock -n 8 || return 0
+
+    local produced=$(read_counter produced)
+    local consumed=$(read_counter consumed)
+    if [ $((produced - consumed)) -ge "${POOL_LOW}" ]; then
+        return 0
+    fi
+
+    local compiled_name=$(compile_cached leansig_pool ${POOL_PARAMS} ${POOL_BATCH} ${POOL_OPTIONS})
+    echo "Adding keys ${produced} to $((produced + POOL_BATCH - 1))"
+    if run_pool_program "${compiled_name}" "${REFILL_PORT}" PoolRefill-Input "${produced}" > /dev/null; then
+        echo $((produced + POOL_BATCH)) > "${POOL_DIR}/produced"
+    else
+        echo "Refill failed, see the latest log in ${POOL_DIR}/logs"
+    fi
+    exec 8>&-
+}
+
+# Function to sign with the next unused key, which is consumed even if
+# signing fails so that no key is ever used twice
+sign() {
+    local compiled_name=$(compile_cached leansig_sign ${POOL_PARAMS} ${POOL_OPTIONS})
+
+    exec 9> "${POOL_DIR}/sign.lock"
+    flock 9
+    local produced=$(read_counter produced)
+    local key=$(read_counter consumed)
+    if [ "${key}" -ge "${produced}" ]; then
+        echo "Pool is empty, run $0 refill"
+        return 1
+    fi
+    echo $((key + 1)) > "${POOL_DIR}/consumed"
+    exec 9>&-
+
+    local log
+    if log=$(run_pool_program "${compiled_name}" "${SIGN_PORT}" PoolSign-Input "${key}" "$@"); then
+        echo "Signed with key ${key}, log in ${log}"
+    else
+        echo "Signing with key ${key} failed, see the latest log in ${POOL_DIR}/logs"
+        return 1
+    fi
+}
+
+case "$1" in
+    init)
+        rm -f Persistence/Transactions-P*.data
+        echo 0 > "${POOL_DIR}/produced"
+        echo 0 > "${POOL_DIR}/consumed"
+        ;;
+    refill)
+        refill
+        ;;
+    refill-loop)
+        while true; do
+            refill
+            sleep "${POOL_INTERVAL}"
+        done
+        ;;
+    sign)
+        shift
+        sign "$@"
+        ;;
+    status)
+        echo "$(read_counter produced) keys produced, $(read_counter consumed) consumed"
+        ;;
+    *)
+        sed -n '2,10p' "$0"
+        exit 1
+        ;;
+esac
@@ -1,14 +1,33 @@
 #!/usr/bin/env python3
 """
 Simple parser for MPC benchmark logs that outputs plain text tables.
-Usage: python parse_logs.py <log_directory> --prefix <prefix> [--output table.txt]
+Usage: python parse_logs.py <log_directory> --prefix <prefix> [--output table.txt] [--profile]
+                            [--save-baseline baseline.json] [--baseline baseline.json] [--alpha 0.05]
+                            [--json runs.json] [--csv runs.csv] [--sqlite results.db] [--jobs N]
+
+--json and --csv write the raw figures of every run, and --sqlite keeps them
+in a store that only parses new or changed logs. Runs of logs that no longer
+exist where they were stored, such as those moved to stale/ when a cell is
+re-run, are dropped from the store.
+
+With --profile, logs of programs compiled with 'profile' are also broken down
+per Poseidon2 phase.
+
+Repeated runs of a cell are shown as medians in the table, followed by their
+mean, standard deviation and confidence interval. --save-baseline stores all
+samples, and --baseline compares against stored samples with Welch's t-test
+and exits with status 2 if a significant regression is found.
 """
 
+import csv
+import json
+import math
 import re
+import sqlite3
 import sys
 from pathlib import Path
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, asdict
 from typing import Dict, List, Optional, Tuple
 
 # Configuration for different benchmark types
@@ -49,61 +68,385 @@ class Result:
     com_rounds: int
     on_time: float
     on_data: float
+    # Phase name -> time, data, rounds, calls, openings, squares
+    phases: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # Raw figures of the party whose output is in the log
+    party: int = 0
+    off_rounds: int = 0
+    global_data: float = 0.0
+    preprocessing: Dict[str, int] = field(default_factory=dict)
+    file: str = ""
+    run: int = 0
+    # Compile options after the parameters in the program name, e.g.
+    # 'unroll=4-powers', which make it a different program
+    variant: str = ""
+
+# Preprocessing types counted in the Prec. column
+PREC_TYPES = ['Triples', 'Squares', 'Bits', 'Inputs']
+
+RUNNING_RE = re.compile(r'Running .*?([\w-]+)-party\.x (\d+)')
+PREP_ITEM_RE = re.compile(r'^\s*(\d+)\s+([A-Za-z][A-Za-z ]*?)\s*$')
+PHASE_RE = re.compile(r'([\d.]+)\s+seconds\s+\(([\d.]+)\s+MB,\s+(\d+)\s+rounds\)\s+on the (preprocessing/offline|online) phase')
+GLOBAL_RE = re.compile(r'Global data sent = ([\d.]+) MB')
+TIMER_RE = re.compile(r'Time(\d+) = ([\d.e+-]+) seconds(?: \(([\d.e+-]+) MB, (\d+) rounds\))?')
+PROFILE_RE = re.compile(r'Poseidon2 profile (\w+): timer (\d+), (\d+) calls, (\d+) openings, (\d+) squares')
 
-def parse_log(filepath: Path, prefix: str) -> Optional[Result]:
-    """Parse a single log file."""
+def profile_phases(timers: Dict[int, Tuple], counters: List[Tuple]) -> Dict[str, Dict[str, float]]:
+    """Combine the timers and counters of a profiled program per phase."""
+    phases = {}
+    for name, timer, calls, openings, squares in counters:
+        time, data, rounds = timers.get(int(timer), (0.0, 0.0, 0))
+        phases[name] = {
+            "time": time,
+            "data": data,
+            "rounds": rounds,
+            "calls": int(calls),
+            "openings": int(openings),
+            "squares": int(squares),
+        }
+    if phases and 1 in timers:
+        phases["total"] = dict(zip(("time", "data", "rounds"), timers[1]))
+    return phases
+
+def parse_log(filepath: Path, prefix: str) -> List[Result]:
+    """Parse a single log file in one pass over its lines, returning one
+    result per run it contains."""
     config = CONFIGS.get(prefix)
     if not config:
-        return None
-    
-    with open(filepath, 'r') as f:
-        content = f.read()
+        return []
     
     # Extract parameters from filename
     match = re.search(config["pattern"], filepath.name)
     if not match:
-        return None
+        return []
     params = tuple(int(g) for g in match.groups())
     
-    # Extract protocol
-    protocol = None
-    for key, name in PROTOCOL_MAP.items():
-        if key in filepath.name or f'{key}-party.x' in content:
-            protocol = name
-            break
-    if not protocol:
-        return None
-    
     # Extract delay
     delay_match = re.search(r'_(1ms|10ms|100ms)_', filepath.name)
     if not delay_match:
-        return None
+        return []
     d = DELAY_TO_D[delay_match.group(1)]
     
-    # Extract preprocessing cost (sum all operations)
-    prec = 0
-    prep_section = re.search(r'Actual preprocessing cost of program:(.*?)(?:Command line:|Coordination took|$)', 
-                             content, re.DOTALL)
-    if prep_section:
-        for op in ['Triples', 'Squares', 'Bits', 'Inputs']:
-            m = re.search(rf'(\d+)\s+{op}', prep_section.group(1))
-            if m:
-                prec += int(m.group(1))
+    # The compiled program name is followed by the protocol in the file name
+    variant = filepath.name[match.end():delay_match.start()].rsplit('_', 1)[0].lstrip('-')
     
-    # Extract offline phase
-    off_match = re.search(r'([\d.]+)\s+seconds\s+\(([\d.]+)\s+MB,\s+\d+\s+rounds\)\s+on the preprocessing/offline phase', 
-                         content)
-    off_time = float(off_match.group(1)) if off_match else 0.0
-    off_data = float(off_match.group(2)) if off_match else 0.0
+    protocol, party = None, 0
+    # Every run is [preprocessing, offline, online, profile phases]. The
+    # profile and timers of a run come before its phases, which MP-SPDZ
+    # reports on one line, followed by the preprocessing cost of the run.
+    runs, global_data = [], []
+    timers, counters = {}, []
+    preprocessing, cost, offline = {}, None, (0.0, 0.0, 0)
+    with open(filepath, 'r', errors='replace') as f:
+        for line in f:
+            if cost is not None:
+                m = PREP_ITEM_RE.match(line)
+                if m:
+                    cost[m.group(2)] = cost.get(m.group(2), 0) + int(m.group(1))
+                    continue
+                if 'Command line:' in line or 'Coordination took' in line:
+                    cost = None
+            if 'Actual preprocessing cost of program:' in line:
+                # A cost reported before any run belongs to the next one
+                cost = runs[-1][0] if runs else preprocessing
+                cost.clear()
+            elif 'seconds' in line and 'phase' in line:
+                times = {m.group(4): (float(m.group(1)), float(m.group(2)), int(m.group(3)))
+                         for m in PHASE_RE.finditer(line)}
+                offline = times.get('preprocessing/offline', offline)
+                if 'online' in times:
+                    runs.append([preprocessing, offline, times['online'], profile_phases(timers, counters)])
+                    preprocessing, cost, offline = {}, None, (0.0, 0.0, 0)
+                    timers, counters = {}, []
+            elif 'Running' in line and protocol is None:
+                m = RUNNING_RE.search(line)
+                if m and m.group(1) in PROTOCOL_MAP:
+                    protocol, party = PROTOCOL_MAP[m.group(1)], int(m.group(2))
+            elif 'Global data sent' in line:
+                m = GLOBAL_RE.search(line)
+                if m:
+                    global_data.append(float(m.group(1)))
+            elif line.startswith('Time'):
+                m = TIMER_RE.match(line)
+                if m:
+                    timers[int(m.group(1))] = (float(m.group(2)), float(m.group(3) or 0), int(m.group(4) or 0))
+            elif line.startswith('Poseidon2 profile'):
+                m = PROFILE_RE.match(line)
+                if m:
+                    counters.append(m.groups())
     
-    # Extract online phase
-    on_match = re.search(r'([\d.]+)\s+seconds\s+\(([\d.]+)\s+MB,\s+(\d+)\s+rounds\)\s+on the online phase', 
-                        content)
-    on_time = float(on_match.group(1)) if on_match else 0.0
-    on_data = float(on_match.group(2)) if on_match else 0.0
-    com_rounds = int(on_match.group(3)) if on_match else 0
+    # Fall back to the file name if the log does not show the binary
+    if not protocol:
+        for key, name in PROTOCOL_MAP.items():
+            if key in filepath.name:
+                protocol = name
+                break
+    if not protocol:
+        return []
     
-    return Result(protocol, params, d, prec, off_time, off_data, com_rounds, on_time, on_data)
+    results = []
+    for i, (prep, (off_time, off_data, off_rounds), (on_time, on_data, com_rounds), phases) in enumerate(runs):
+        # The preprocessing cost is reported once per program
+        prep = prep or (runs[0][0] if runs else {})
+        prec = sum(prep.get(op, 0) for op in PREC_TYPES)
+        results.append(Result(protocol, params, d, prec, off_time, off_data, com_rounds, on_time, on_data,
+                              phases, party, off_rounds, global_data[i] if i < len(global_data) else 0.0,
+                              prep, str(filepath), i, variant))
+    return results
+
+def parse_files(log_files: List[Path], prefix: str, jobs: int = 0) -> List[List[Result]]:
+    """Parse log files, in a process pool if there are many of them."""
+    if jobs == 1 or len(log_files) < 64:
+        return [parse_log(f, prefix) for f in log_files]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+        return list(pool.map(parse_log, log_files, [prefix] * len(log_files), chunksize=16))
+
+def result_record(r: Result) -> Dict:
+    record = asdict(r)
+    record["params"] = list(r.params)
+    return record
+
+def write_json(results: List[Result], filepath: str):
+    with open(filepath, 'w') as f:
+        json.dump([result_record(r) for r in results], f, indent=2)
+
+def write_csv(results: List[Result], filepath: str):
+    """One row per run, with a column per preprocessing type."""
+    prep_types = sorted({t for r in results for t in r.preprocessing})
+    columns = [f.name for f in fields(Result) if f.name not in ("phases", "preprocessing")]
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + [f"prep_{t}" for t in prep_types])
+        for r in results:
+            record = result_record(r)
+            record["params"] = "-".join(map(str, r.params))
+            writer.writerow([record[c] for c in columns] + [r.preprocessing.get(t, 0) for t in prep_types])
+
+# Version of the store schema, kept as the user_version of the database
+STORE_VERSION = 2
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (file TEXT, prefix TEXT, mtime REAL, size INTEGER, PRIMARY KEY (file, prefix));
+CREATE TABLE IF NOT EXISTS runs (
+    file TEXT, run INTEGER, prefix TEXT, protocol TEXT, params TEXT, variant TEXT, d INTEGER, party INTEGER,
+    prec INTEGER, off_time REAL, off_data REAL, off_rounds INTEGER, com_rounds INTEGER,
+    on_time REAL, on_data REAL, global_data REAL, preprocessing TEXT, phases TEXT,
+    PRIMARY KEY (file, prefix, run)
+);
+"""
+
+def matches_prefix(filepath: Path, prefix: str) -> bool:
+    """Whether a log belongs to the benchmark of prefix. The file name alone
+    does not tell, as leansig is also part of leansig_prec."""
+    return re.search(CONFIGS[prefix]["pattern"], filepath.name) is not None
+
+def ingest(db: sqlite3.Connection, log_files: List[Path], prefix: str, jobs: int = 0) -> int:
+    """Parse the logs that are new or changed since they were last stored,
+    and drop those that were removed or moved away. Returns the number of
+    parsed files."""
+    # The store only caches the logs, so a store of an older schema is
+    # rebuilt from them
+    if db.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+        db.executescript(f"DROP TABLE IF EXISTS runs; DROP TABLE IF EXISTS logs; PRAGMA user_version = {STORE_VERSION};")
+    db.executescript(STORE_SCHEMA)
+    known = {row[0]: (row[1], row[2]) for row in db.execute("SELECT file, mtime, size FROM logs WHERE prefix = ?", (prefix,))}
+    for file in known:
+        if not Path(file).exists():
+            db.execute("DELETE FROM runs WHERE file = ? AND prefix = ?", (file, prefix))
+            db.execute("DELETE FROM logs WHERE file = ? AND prefix = ?", (file, prefix))
+    changed = []
+    for f in log_files:
+        if not matches_prefix(f, prefix):
+            continue
+        stat = f.stat()
+        if known.get(str(f)) != (stat.st_mtime, stat.st_size):
+            changed.append((f, stat))
+    
+    for (f, stat), runs in zip(changed, parse_files([f for f, _ in changed], prefix, jobs)):
+        db.execute("DELETE FROM runs WHERE file = ? AND prefix = ?", (str(f), prefix))
+        db.execute("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?)", (str(f), prefix, stat.st_mtime, stat.st_size))
+        for r in runs:
+            db.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (r.file, r.run, prefix, r.protocol, json.dumps(list(r.params)), r.variant, r.d, r.party,
+                        r.prec, r.off_time, r.off_data, r.off_rounds, r.com_rounds,
+                        r.on_time, r.on_data, r.global_data, json.dumps(r.preprocessing), json.dumps(r.phases)))
+    db.commit()
+    return len(changed)
+
+def load_store(db: sqlite3.Connection, prefix: str) -> List[Result]:
+    results = []
+    for (file, run, protocol, params, variant, d, party, prec, off_time, off_data, off_rounds, com_rounds,
+         on_time, on_data, global_data, preprocessing, phases) in db.execute(
+            "SELECT file, run, protocol, params, variant, d, party, prec, off_time, off_data, off_rounds, com_rounds, "
+            "on_time, on_data, global_data, preprocessing, phases FROM runs WHERE prefix = ? ORDER BY file, run", (prefix,)):
+        results.append(Result(protocol, tuple(json.loads(params)), d, prec, off_time, off_data, com_rounds,
+                              on_time, on_data, json.loads(phases), party, off_rounds, global_data,
+                              json.loads(preprocessing), file, run, variant))
+    return results
+
+# Metrics that are aggregated over repeated runs
+METRICS = ["off_time", "off_data", "com_rounds", "on_time", "on_data"]
+
+def group_runs(results: List[Result]) -> Dict[Tuple, List[Result]]:
+    """Group repeated runs by (params, variant, protocol, d)."""
+    groups = defaultdict(list)
+    for r in results:
+        groups[(r.params, r.variant, r.protocol, r.d)].append(r)
+    return groups
+
+def median(values: List[float]) -> float:
+    values = sorted(values)
+    n = len(values)
+    return values[n // 2] if n % 2 else (values[n // 2 - 1] + values[n // 2]) / 2
+
+def aggregate(results: List[Result]) -> List[Result]:
+    """Collapse repeated runs of every cell into one result of medians."""
+    aggregated = []
+    for runs in group_runs(results).values():
+        values = {m: median([getattr(r, m) for r in runs]) for m in METRICS}
+        aggregated.append(Result(runs[0].protocol, runs[0].params, runs[0].d, max(r.prec for r in runs),
+                                 values["off_time"], values["off_data"], int(values["com_rounds"]),
+                                 values["on_time"], values["on_data"], runs[0].phases,
+                                 variant=runs[0].variant))
+    return aggregated
+
+def incomplete_beta(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b) by its continued fraction."""
+    if x <= 0 or x >= 1:
+        return max(0.0, min(1.0, x))
+    if x > (a + 1) / (a + b + 2):
+        return 1 - incomplete_beta(b, a, 1 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x)) / a
+    # Lentz's algorithm
+    f, c, d = 1.0, 1.0, 0.0
+    for i in range(200):
+        m = i // 2
+        if i == 0:
+            numerator = 1.0
+        elif i % 2 == 0:
+            numerator = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        else:
+            numerator = -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))
+        d = 1 + numerator * d
+        d = 1 / (d if abs(d) > 1e-30 else 1e-30)
+        c = 1 + numerator / (c if abs(c) > 1e-30 else 1e-30)
+        f *= c * d
+        if abs(c * d - 1) < 1e-12:
+            break
+    return front * (f - 1)
+
+def t_two_sided_p(t: float, df: float) -> float:
+    """Two-sided p-value of Student's t distribution."""
+    return incomplete_beta(df / 2, 0.5, df / (df + t * t))
+
+def t_quantile(confidence: float, df: float) -> float:
+    """Two-sided critical value of Student's t distribution, by bisection."""
+    lo, hi = 0.0, 1e3
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if t_two_sided_p(mid, df) > 1 - confidence:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+@dataclass
+class Summary:
+    n: int
+    median: float
+    mean: float
+    std: float
+    ci: float  # half-width of the confidence interval of the mean
+
+def summarize(values: List[float], confidence: float = 0.95) -> Summary:
+    n = len(values)
+    mean = sum(values) / n
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+    ci = t_quantile(confidence, n - 1) * std / math.sqrt(n) if n > 1 else 0.0
+    return Summary(n, median(values), mean, std, ci)
+
+def welch_test(a: List[float], b: List[float]) -> Optional[float]:
+    """Two-sided p-value of Welch's t-test for equal means of a and b, or
+    None if either has fewer than two samples and thus no variance."""
+    if len(a) < 2 or len(b) < 2:
+        return None
+    sa, sb = summarize(a), summarize(b)
+    va, vb = sa.std ** 2 / sa.n, sb.std ** 2 / sb.n
+    if va + vb == 0:
+        # Deterministic metrics (data, rounds) either changed or did not
+        return 0.0 if sa.mean != sb.mean else 1.0
+    t = (sa.mean - sb.mean) / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / ((va ** 2 / (sa.n - 1)) + (vb ** 2 / (sb.n - 1)))
+    return t_two_sided_p(t, df)
+
+def program_label(params: Tuple, variant: str) -> str:
+    return "-".join(map(str, params + ((variant,) if variant else ())))
+
+def cell_name(cell: Tuple) -> str:
+    params, variant, protocol, d = cell
+    return f"{program_label(params, variant)}|{protocol}|{d}"
+
+def generate_stats_table(results: List[Result], prefix: str) -> str:
+    """Generate plain text table of the spread over repeated runs."""
+    config = CONFIGS[prefix]
+    lines = []
+    lines.append(f"{config['grouping']:<15} Protocol      d     n    Metric      Median    Mean      Std       95% CI")
+    lines.append("-" * 120)
+    for cell, runs in sorted(group_runs(results).items()):
+        params, variant, protocol, d = cell
+        param_str = program_label(params, variant)
+        for metric in ["off_time", "off_data", "on_time", "on_data"]:
+            st = summarize([getattr(r, metric) for r in runs])
+            lines.append(f"{param_str:<15} {protocol:<13} {d:<5} {st.n:<4} {metric:<11} {format_num(st.median):<9} "
+                         f"{format_num(st.mean):<9} {st.std:<9.3g} [{st.mean - st.ci:.3g}, {st.mean + st.ci:.3g}]")
+            param_str = ""
+        lines.append("")
+    return "\n".join(lines)
+
+def save_baseline(results: List[Result], prefix: str, filepath: str):
+    """Store the samples of every cell for later comparison."""
+    try:
+        with open(filepath) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+    baseline[prefix] = {cell_name(cell): {m: [getattr(r, m) for r in runs] for m in METRICS}
+                        for cell, runs in group_runs(results).items()}
+    with open(filepath, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+def compare_baseline(results: List[Result], prefix: str, filepath: str, alpha: float) -> Tuple[str, int]:
+    """Compare every cell against the baseline samples. Returns the report
+    and the number of significant regressions."""
+    with open(filepath) as f:
+        baseline = json.load(f).get(prefix, {})
+    lines = [f"Comparison with {filepath} (Welch's t-test, alpha={alpha})"]
+    regressions = 0
+    for cell, runs in sorted(group_runs(results).items()):
+        name = cell_name(cell)
+        if name not in baseline:
+            continue
+        if len(runs) < 2 or len(baseline[name][METRICS[0]]) < 2:
+            lines.append(f"{'insufficient samples':<12} {name:<30} n={len(runs)}/{len(baseline[name][METRICS[0]])}, "
+                         "needs REPETITIONS >= 2 on both sides")
+            continue
+        for metric in METRICS:
+            old = baseline[name][metric]
+            new = [getattr(r, metric) for r in runs]
+            p = welch_test(new, old)
+            if p >= alpha:
+                continue
+            old_mean, new_mean = sum(old) / len(old), sum(new) / len(new)
+            change = (new_mean - old_mean) / old_mean * 100 if old_mean else float("inf")
+            if new_mean > old_mean:
+                regressions += 1
+                label = "REGRESSION"
+            else:
+                label = "improvement"
+            lines.append(f"{label:<12} {name:<30} {metric:<11} {old_mean:.4g} -> {new_mean:.4g} ({change:+.1f}%, p={p:.3g}, n={len(new)}/{len(old)})")
+    if not any(line.startswith(("REGRESSION", "improvement")) for line in lines[1:]):
+        lines.append("No significant changes")
+    return "\n".join(lines), regressions
 
 def format_num(val: float) -> str:
     """Format number for table display."""
@@ -122,10 +465,10 @@ def generate_table(results: List[Result], prefix: str) -> str:
     """Generate plain text table."""
     config = CONFIGS[prefix]
     
-    # Group by params and protocol
+    # Group by program and protocol
     grouped = defaultdict(lambda: defaultdict(lambda: {}))
     for r in results:
-        grouped[r.params][r.protocol][r.d] = r
+        grouped[(r.params, r.variant)][r.protocol][r.d] = r
     
     lines = []
     
@@ -145,13 +488,13 @@ def generate_table(results: List[Result], prefix: str) -> str:
     lines.append("-" * 140)
     
     # Data rows
-    for params in sorted(grouped.keys()):
+    for params, variant in sorted(grouped.keys()):
         first_row = True
         for protocol in ['MAMA', 'MASCOT', 'ATLAS', 'Mal. Shamir']:
-            if protocol not in grouped[params]:
+            if protocol not in grouped[(params, variant)]:
                 continue
             
-            d_results = grouped[params][protocol]
+            d_results = grouped[(params, variant)][protocol]
             
             # Get data for each delay
             r1 = d_results.get(1)
@@ -187,6 +530,8 @@ def generate_table(results: List[Result], prefix: str) -> str:
                 param_str = str(params[2]) if first_row else ""  # Use 3rd param (n_σ)
             else:  # leansig
                 param_str = f"({params[0]}, {params[1]}, {params[2]})" if first_row else ""
+            if variant and first_row:
+                param_str += f" {variant}"
             
             if has_combined:
                 # Combined times
@@ -210,47 +555,100 @@ def generate_table(results: List[Result], prefix: str) -> str:
     
     return "\n".join(lines)
 
+def generate_profile_table(results: List[Result], prefix: str) -> str:
+    """Generate plain text per-phase breakdown of profiled results."""
+    config = CONFIGS[prefix]
+    lines = []
+    lines.append(f"{config['grouping']:<15} Protocol      d     Phase          Time (s)  Share   Rounds    Data(MB)  Calls     Openings    Squares")
+    lines.append("-" * 120)
+    
+    for r in sorted(results, key=lambda r: (r.params, r.variant, r.protocol, r.d)):
+        if not r.phases:
+            continue
+        total = r.phases.get("total", {}).get("time", 0.0)
+        param_str = program_label(r.params, r.variant)
+        for name, phase in r.phases.items():
+            share = f"{100 * phase['time'] / total:.1f}%" if total else "-"
+            line = f"{param_str:<15} {r.protocol:<13} {r.d:<5} {name:<14} {format_num(phase['time']):<9} {share:<7} {phase['rounds']:<9} {format_num(phase['data']):<9} "
+            line += f"{phase.get('calls', '-'):<9} {phase.get('openings', '-'):<11} {phase.get('squares', '-')}"
+            lines.append(line)
+            param_str = ""
+        lines.append("")
+    
+    return "\n".join(lines)
+
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python parse_logs.py <log_directory> --prefix <prefix> [--output table.txt]")
+        print("Usage: python parse_logs.py <log_directory> --prefix <prefix> [--output table.txt] [--profile]")
+        print("                            [--save-baseline baseline.json] [--baseline baseline.json] [--alpha 0.05]")
+        print("                            [--json runs.json] [--csv runs.csv] [--sqlite results.db] [--jobs N]")
         print("\nAvailable prefixes:")
         for p in CONFIGS.keys():
             print(f"  - {p}")
         print("\nExamples:")
         print("  python parse_logs.py ./results --prefix poseidon2_chains")
         print("  python parse_logs.py ./results --prefix leansig --output table3.txt")
+        print("  python parse_logs.py ./results --prefix leansig --baseline baseline.json")
+        print("  python parse_logs.py ./results --prefix leansig_prec --sqlite results.db --csv runs.csv")
         sys.exit(1)
     
     log_dir = Path(sys.argv[1])
     prefix = None
     output_file = None
+    baseline_file = None
+    save_baseline_file = None
+    alpha = 0.05
+    json_file = None
+    csv_file = None
+    store_file = None
+    jobs = 0
     
     for i, arg in enumerate(sys.argv[2:], start=2):
         if arg == "--prefix" and i + 1 < len(sys.argv):
             prefix = sys.argv[i + 1]
         elif arg == "--output" and i + 1 < len(sys.argv):
             output_file = sys.argv[i + 1]
+        elif arg == "--baseline" and i + 1 < len(sys.argv):
+            baseline_file = sys.argv[i + 1]
+        elif arg == "--save-baseline" and i + 1 < len(sys.argv):
+            save_baseline_file = sys.argv[i + 1]
+        elif arg == "--alpha" and i + 1 < len(sys.argv):
+            alpha = float(sys.argv[i + 1])
+        elif arg == "--json" and i + 1 < len(sys.argv):
+            json_file = sys.argv[i + 1]
+        elif arg == "--csv" and i + 1 < len(sys.argv):
+            csv_file = sys.argv[i + 1]
+        elif arg == "--sqlite" and i + 1 < len(sys.argv):
+            store_file = sys.argv[i + 1]
+        elif arg == "--jobs" and i + 1 < len(sys.argv):
+            jobs = int(sys.argv[i + 1])
     
     if not prefix or prefix not in CONFIGS:
         print(f"Error: Invalid prefix. Available: {list(CONFIGS.keys())}")
         sys.exit(1)
     
     # Find log files
-    log_files = [f for f in log_dir.glob("*.log") if prefix in f.name]
-    log_files += [f for f in log_dir.glob("*.txt") if prefix in f.name]
+    log_files = [f for f in log_dir.glob("*.log") if matches_prefix(f, prefix)]
+    log_files += [f for f in log_dir.glob("*.txt") if matches_prefix(f, prefix)]
     
-    if not log_files:
+    if not log_files and not store_file:
         print(f"No log files found with prefix '{prefix}'")
         sys.exit(1)
     
-    print(f"Parsing {len(log_files)} log files...")
-    
-    results = []
-    for log_file in log_files:
-        r = parse_log(log_file, prefix)
-        if r:
-            results.append(r)
-            print(f"✓ {log_file.name}: {r.protocol}, params={r.params}, d={r.d}")
+    if store_file:
+        db = sqlite3.connect(store_file)
+        print(f"Parsing new or changed log files out of {len(log_files)}...")
+        print(f"Parsed {ingest(db, log_files, prefix, jobs)} log files into {store_file}")
+        results = load_store(db, prefix)
+        db.close()
+    else:
+        print(f"Parsing {len(log_files)} log files...")
+        results = []
+        for log_file, runs in zip(log_files, parse_files(log_files, prefix, jobs)):
+            if runs:
+                results += runs
+                r = runs[0]
+                print(f"✓ {log_file.name}: {r.protocol}, params={r.params}, d={r.d}, runs={len(runs)}")
     
     if not results:
         print("No valid results found")
@@ -258,8 +656,27 @@ def main():
     
     print(f"\nParsed {len(results)} results")
     
+    if json_file:
+        write_json(results, json_file)
+        print(f"Runs written to {json_file}")
+    if csv_file:
+        write_csv(results, csv_file)
+        print(f"Runs written to {csv_file}")
+    
     # Generate table
-    table = generate_table(results, prefix)
+    table = generate_table(aggregate(results), prefix)
+    if any(len(runs) > 1 for runs in group_runs(results).values()):
+        table += "\n\nRepeated runs\n" + generate_stats_table(results, prefix)
+    if "--profile" in sys.argv:
+        table += "\n\nPer-phase profile\n" + generate_profile_table(results, prefix)
+    
+    regressions = 0
+    if baseline_file:
+        report, regressions = compare_baseline(results, prefix, baseline_file, alpha)
+        table += "\n\n" + report
+    if save_baseline_file:
+        save_baseline(results, prefix, save_baseline_file)
+        print(f"Baseline written to {save_baseline_file}")
     
     if output_file:
         with open(output_file, 'w') as f:
@@ -269,6 +686,9 @@ def main():
         print("\n" + "=" * 120)
         print(table)
         print("=" * 120)
+    
+    if regressions:
+        sys.exit(2)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,7 +5,7 @@ source "$(dirname "$0")/benchmark_common.sh"
 PROGRAM_NAME="poseidon2_chains"
 CHAIN_LENGTHS=(8 128 512)
 
-trap cleanup_network EXIT INT TERM
+trap "cleanup_network; cleanup_namespaces" EXIT INT TERM
 
 run_benchmark_suite "${PROGRAM_NAME}" "${CHAIN_LENGTHS[@]}"
 
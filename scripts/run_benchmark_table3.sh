@@ -9,7 +9,7 @@ LEANSIG_INSTANCES=(
     "68 4 114"
 )
 
-trap cleanup_network EXIT INT TERM
+trap "cleanup_network; cleanup_namespaces" EXIT INT TERM
 
 run_benchmark_suite "${PROGRAM_NAME}" "${LEANSIG_INSTANCES[@]}"
 
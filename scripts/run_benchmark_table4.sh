@@ -9,7 +9,7 @@ PARAMETERS=(
     "68 4 4"
 )
 
-trap cleanup_network EXIT INT TERM
+trap "cleanup_network; cleanup_namespaces" EXIT INT TERM
 
 run_benchmark_suite "${PROGRAM_NAME}" "${PARAMETERS[@]}"
 
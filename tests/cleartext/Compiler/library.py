@@ -0,0 +1,30 @@
+"""Cleartext model of the MP-SPDZ library functions used by poseidon2.py.
+Runtime loops run in Python and runtime errors raise RuntimeError."""
+
+timers = []
+output = []
+
+
+def for_range(n):
+    def decorator(body):
+        for i in range(int(n)):
+            body(i)
+        return body
+    return decorator
+
+
+def runtime_error_if(condition, message, *args):
+    if int(condition):
+        raise RuntimeError(message)
+
+
+def start_timer(timer):
+    timers.append(('start', timer))
+
+
+def stop_timer(timer):
+    timers.append(('stop', timer))
+
+
+def print_ln(format, *args):
+    output.append(format % args)
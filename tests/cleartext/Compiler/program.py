@@ -0,0 +1,10 @@
+"""Cleartext model of the MP-SPDZ program being compiled, of which
+poseidon2.py reads the prime given with -P."""
+
+
+class Program:
+    prog = None
+
+    def __init__(self, prime):
+        self.prime = prime
+        Program.prog = self
@@ -0,0 +1,250 @@
+"""Cleartext model of the MP-SPDZ types used by poseidon2.py. Secret and
+public values are plain vectors of integers modulo the current prime, and
+containers are views on flat lists, so programs run directly in Python.
+Memory is filled with random values on allocation, as uninitialised
+memory is not zero in MP-SPDZ either."""
+
+import random
+
+# Modulus of the current program, set by the tests per field
+prime = [2**31 - 2**24 + 1]
+rng = random.Random(0)
+# Number of openings and opened elements
+stats = {'openings': 0, 'opened': 0}
+# Persistence file of the secret shares, by position
+persistence = {}
+
+
+def values(x, size=None):
+    if isinstance(x, Vector):
+        return x.values
+    if isinstance(x, MemValue):
+        x = x.read()
+    return [int(x) % prime[0]] * (size or 1)
+
+
+class Vector:
+    def __init__(self, values, secret=True):
+        self.values = [int(x) % prime[0] for x in values]
+        self.secret = secret
+
+    @property
+    def size(self):
+        return len(self.values)
+
+    def binary(self, other, op):
+        a = self.values
+        if isinstance(other, Vector):
+            b, secret = other.values, self.secret or other.secret
+        else:
+            b, secret = [int(other)], self.secret
+        # Size 1 broadcasts, as a scalar register would
+        if len(a) == 1:
+            a = a * len(b)
+        if len(b) == 1:
+            b = b * len(a)
+        assert len(a) == len(b), ('Size mismatch', len(a), len(b))
+        return Vector([op(x, y) for x, y in zip(a, b)], secret)
+
+    def __add__(self, other):
+        return self.binary(other, lambda x, y: x + y)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.binary(other, lambda x, y: x - y)
+
+    def __rsub__(self, other):
+        return self.binary(other, lambda x, y: y - x)
+
+    def __mul__(self, other):
+        return self.binary(other, lambda x, y: x * y)
+
+    __rmul__ = __mul__
+
+    def __gt__(self, other):
+        return self.binary(other, lambda x, y: int(x > y))
+
+    def __ge__(self, other):
+        return self.binary(other, lambda x, y: int(x >= y))
+
+    def __lt__(self, other):
+        return self.binary(other, lambda x, y: int(x < y))
+
+    def __int__(self):
+        assert self.size == 1
+        return self.values[0]
+
+    __index__ = __int__
+
+    def reveal(self):
+        stats['openings'] += 1
+        stats['opened'] += self.size
+        return Vector(self.values, False)
+
+
+class Container:
+    def __init__(self, secret, data, offset, sizes):
+        self.secret = secret
+        self.data = data
+        self.offset = offset
+        self.sizes = sizes
+
+    def total_size(self):
+        size = 1
+        for s in self.sizes:
+            size *= s
+        return size
+
+    def __len__(self):
+        return self.sizes[0]
+
+    def get_vector(self, base=0, size=None):
+        base = int(base)
+        size = self.total_size() - base if size is None else int(size)
+        assert 0 <= base and base + size <= self.total_size(), ('Out of bounds', base, size, self.sizes)
+        start = self.offset + base
+        return Vector(self.data[start:start + size], self.secret)
+
+    def assign_vector(self, vector, base=0):
+        base = int(base)
+        vector = values(vector)
+        assert base + len(vector) <= self.total_size(), ('Out of bounds', base, len(vector), self.sizes)
+        start = self.offset + base
+        self.data[start:start + len(vector)] = vector
+
+    def assign_all(self, value):
+        size = self.total_size()
+        self.data[self.offset:self.offset + size] = [int(value) % prime[0]] * size
+
+    def assign(self, rows):
+        flat = []
+
+        def flatten(x):
+            if isinstance(x, (list, tuple)):
+                for y in x:
+                    flatten(y)
+            else:
+                flat.append(int(x) % prime[0])
+
+        flatten(rows)
+        assert len(flat) <= self.total_size()
+        self.data[self.offset:self.offset + len(flat)] = flat
+
+
+class Array(Container):
+    def __init__(self, secret, data, offset, size):
+        super().__init__(secret, data, offset, (size,))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            assert index == slice(None)
+            return self.get_vector()
+        index = int(index)
+        assert 0 <= index < len(self), ('Out of bounds', index, self.sizes)
+        return Vector([self.data[self.offset + index]], self.secret)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            assert index == slice(None)
+            return self.assign_vector(value)
+        index = int(index)
+        assert 0 <= index < len(self), ('Out of bounds', index, self.sizes)
+        self.data[self.offset + index] = values(value)[0]
+
+
+class Matrix(Container):
+    def __getitem__(self, row):
+        row = int(row)
+        assert 0 <= row < len(self), ('Out of bounds', row, self.sizes)
+        columns = self.sizes[1]
+        return Array(self.secret, self.data, self.offset + row * columns, columns)
+
+    def get_column(self, column):
+        rows, columns = self.sizes
+        return Vector([self.data[self.offset + i * columns + column] for i in range(rows)], self.secret)
+
+    def set_column(self, column, vector):
+        rows, columns = self.sizes
+        vector = values(vector, rows)
+        assert len(vector) == rows
+        for i in range(rows):
+            self.data[self.offset + i * columns + column] = vector[i]
+
+    def transpose(self):
+        rows, columns = self.sizes
+        result = Matrix(self.secret, [0] * (rows * columns), 0, (columns, rows))
+        for i in range(rows):
+            for j in range(columns):
+                result.data[j * rows + i] = self.data[self.offset + i * columns + j]
+        return result
+
+
+def garbage(size):
+    return [rng.randrange(prime[0]) for _ in range(size)]
+
+
+class ValueType:
+    secret = True
+
+    def __new__(cls, value=0, size=None):
+        return Vector(values(value, size), cls.secret)
+
+    @classmethod
+    def Array(cls, size):
+        return Array(cls.secret, garbage(size), 0, size)
+
+    @classmethod
+    def Matrix(cls, rows, columns):
+        return Matrix(cls.secret, garbage(rows * columns), 0, (rows, columns))
+
+
+class sint(ValueType):
+    secret = True
+
+    @staticmethod
+    def get_random(size=1):
+        return Vector(garbage(size))
+
+    @staticmethod
+    def get_random_square(size=1):
+        r = garbage(size)
+        return Vector(r), Vector([x * x for x in r])
+
+    @staticmethod
+    def write_to_file(shares, position=None):
+        for k, x in enumerate(values(shares)):
+            persistence[int(position) + k] = x
+
+    @staticmethod
+    def read_from_file(start, n_items=1, crash_if_missing=True, size=1):
+        start = int(start)
+        shares = [Vector([persistence[start + i * size + k] for k in range(size)])
+                  for i in range(n_items)]
+        return start + n_items * size, shares
+
+
+class cint(ValueType):
+    secret = False
+
+
+def regint(value=0, size=None):
+    if isinstance(value, Vector):
+        return int(value)
+    if isinstance(value, MemValue):
+        return value.read()
+    return int(value)
+
+
+class MemValue:
+    def __init__(self, value):
+        self.value = int(value)
+
+    def read(self):
+        return self.value
+
+    def write(self, value):
+        self.value = int(value)
+
+    def iadd(self, value):
+        self.value += int(value)
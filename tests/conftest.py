@@ -0,0 +1,61 @@
+"""The tests run the MPC programs in the cleartext model of the MP-SPDZ
+compiler in tests/cleartext and compare them with poseidon2_ref."""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+root = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(root / 'tests' / 'cleartext'), str(root / 'programs'), str(root / 'scripts')]
+
+from Compiler import types
+from Compiler.program import Program
+from Compiler.types import sint, cint
+from poseidon2 import Poseidon2
+from poseidon2_params import FIELDS
+from poseidon2_ref import Poseidon2Ref
+
+
+def matrix(rows, columns, secret=True):
+    result = (sint if secret else cint).Matrix(len(rows), columns)
+    result.assign([[int(x) for x in row] for row in rows])
+    return result
+
+
+def rows(m):
+    return [[int(x) for x in m[i].get_vector().values] for i in range(len(m))]
+
+
+def vector(array):
+    return [int(x) for x in array.get_vector().values]
+
+
+def as_lists(a):
+    return [[int(x) for x in row] for row in a]
+
+
+class Instance:
+    """A Poseidon2 instance in the cleartext model together with its
+    reference and a random source of field elements"""
+
+    def __init__(self, field, t, seed=0, **options):
+        types.prime[0] = FIELDS[field]
+        Program(FIELDS[field])
+        # Instances are cached with their pools, so every test starts anew
+        Poseidon2.instances.clear()
+        self.poseidon2 = Poseidon2.instance(field, t, **options)
+        self.ref = Poseidon2Ref.instance(field, t)
+        self.t = t
+        self.rng = random.Random(seed)
+
+    def elements(self, *shape):
+        if len(shape) == 1:
+            return [self.rng.randrange(self.ref.p) for _ in range(shape[0])]
+        return [self.elements(*shape[1:]) for _ in range(shape[0])]
+
+
+@pytest.fixture
+def instance():
+    return Instance
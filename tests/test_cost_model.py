@@ -0,0 +1,11 @@
+import pytest
+
+from cost_model import estimate
+
+
+@pytest.mark.parametrize('args', [['48', '10', '326'], ['48', '10', '326', 'partial=paired']])
+def test_pool_is_counted_in_the_online_phase(args):
+    plain, pooled = estimate('leansig', args), estimate('leansig', args + ['powers'])
+    assert (pooled.online_rounds, pooled.opens) == (plain.online_rounds, plain.opens)
+    assert pooled.timed_rounds < plain.timed_rounds
+    assert pooled.timed_opens == pooled.sboxes < plain.timed_opens
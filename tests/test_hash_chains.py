@@ -0,0 +1,43 @@
+import pytest
+
+from Compiler.types import cint
+from conftest import matrix, rows, as_lists
+
+LENGTHS = [
+    [3, 0, 1, 3, 2, 1],
+    [0, 0, 0],
+    [2],
+    [0, 4],
+]
+
+
+@pytest.mark.parametrize('field, t', [('koalabear', 16), ('babybear', 8)])
+@pytest.mark.parametrize('unroll', [0, 2])
+@pytest.mark.parametrize('sbox', ['masked', 'square_multiply'])
+@pytest.mark.parametrize('lengths', LENGTHS)
+def test_hash_chains_static(instance, field, t, unroll, sbox, lengths):
+    inst = instance(field, t, unroll=unroll, sbox=sbox)
+    inputs = inst.elements(len(lengths), t)
+    outputs = inst.poseidon2.hash_chains(matrix(inputs, t), lengths)
+    assert rows(outputs) == as_lists(inst.ref.ots(inputs, lengths))
+
+
+@pytest.mark.parametrize('unroll', [0, 2])
+@pytest.mark.parametrize('lengths', LENGTHS)
+def test_hash_chains_runtime(instance, unroll, lengths):
+    inst = instance('koalabear', 16, unroll=unroll)
+    inputs = inst.elements(len(lengths), 16)
+    chainlens = cint.Array(len(lengths))
+    chainlens.assign(lengths)
+    outputs = inst.poseidon2.hash_chains(matrix(inputs, 16), chainlens)
+    assert rows(outputs) == as_lists(inst.ref.ots(inputs, lengths))
+
+
+# Fields with alpha = 3, 5 and 7
+@pytest.mark.parametrize('field, t', [('koalabear', 16), ('bn254', 3), ('babybear', 8), ('goldilocks', 8)])
+@pytest.mark.parametrize('unroll', [0, 3])
+def test_hash_chain_square_multiply(instance, field, t, unroll):
+    inst = instance(field, t, unroll=unroll, sbox='square_multiply')
+    inputs = inst.elements(3, t)
+    outputs = inst.poseidon2.hash_chain_batch(matrix(inputs, t), 2)
+    assert rows(outputs) == as_lists(inst.ref.hash_chain(inputs, 2))
@@ -0,0 +1,61 @@
+import pytest
+
+from Compiler.types import sint
+from poseidon2 import MerkleTree
+from conftest import matrix, rows, vector, as_lists
+
+
+@pytest.mark.parametrize('height', [1, 3])
+@pytest.mark.parametrize('secret', [True, False])
+def test_levels_and_paths(instance, height, secret):
+    inst = instance('koalabear', 16)
+    d = 8
+    leaves = inst.elements(2**height, d)
+    tree = MerkleTree(inst.poseidon2, matrix(leaves, d, secret))
+    levels = inst.ref.merkle_levels(leaves)
+    assert [rows(level) for level in tree.levels] == [as_lists(level) for level in levels]
+    assert vector(tree.root) == as_lists(levels[-1])[0]
+    for index in range(2**height):
+        leaf = sint.Array(d)
+        leaf.assign(leaves[index])
+        root = inst.poseidon2.merkle_root_from_path(leaf, index, tree.auth_path(index))
+        assert vector(root) == as_lists(levels[-1])[0]
+
+
+@pytest.mark.parametrize('indices', [[0], [2, 3], [1, 4, 6], [7, 0, 5, 2]])
+def test_update(instance, indices):
+    inst = instance('babybear', 8, unroll=2)
+    d = 4
+    leaves = inst.elements(8, d)
+    tree = MerkleTree(inst.poseidon2, matrix(leaves, d), unroll=2)
+    new_leaves = inst.elements(len(indices), d)
+    tree.update(indices, matrix(new_leaves, d))
+    for index, leaf in zip(indices, new_leaves):
+        leaves[index] = leaf
+    levels = inst.ref.merkle_levels(leaves)
+    assert [rows(level) for level in tree.levels] == [as_lists(level) for level in levels]
+
+
+def test_keygen_pool(instance):
+    """Runs leansig_keygen.mpc with 'powers', whose pool must cover every
+    permutation of key generation"""
+    inst = instance('koalabear', 16)
+    poseidon2, t, d = inst.poseidon2, 16, 8
+    height, chunks, w = 2, 3, 3
+    leaves = 2**height
+    pool = poseidon2.preprocess_powers(poseidon2.keygen_permutations(height, chunks, w))
+    seeds = inst.elements(leaves * chunks, t)
+
+    chain_ends = poseidon2.ots(matrix(seeds, t), w - 1, leaves * chunks)
+    keys = sint.Matrix(leaves, chunks * t)
+    keys.assign_vector(chain_ends.get_vector())
+    public_keys = sint.Matrix(leaves, chunks * d)
+    for c in range(chunks):
+        for j in range(d):
+            public_keys.set_column(c * d + j, keys.get_column(c * t + j))
+    tree = MerkleTree(poseidon2, poseidon2.sponge_hash_batch(public_keys, d))
+    assert pool.used.read() == pool.size
+
+    ref_ends = inst.ref.hash_chain(seeds, w - 1).reshape(leaves, chunks, t)[:, :, :d]
+    digests = inst.ref.sponge_hash(ref_ends.reshape(leaves, chunks * d), d)
+    assert vector(tree.root) == as_lists(inst.ref.merkle_levels(digests)[-1])[0]
@@ -0,0 +1,44 @@
+import pytest
+
+from Compiler import types
+from Compiler.types import cint
+from poseidon2 import OTSPool
+from conftest import rows, as_lists
+
+
+def encoding(chunks, digits):
+    enc_msg = cint.Array(chunks)
+    enc_msg.assign(digits)
+    return enc_msg
+
+
+@pytest.fixture
+def pool(instance):
+    types.persistence.clear()
+    inst = instance('koalabear', 16)
+    pool = OTSPool(inst.poseidon2, 3, 4)
+    pool.refill(0, 2)
+    pool.refill(2, 1)
+    return inst, pool
+
+
+def seeds(pool, key):
+    """The random chain starts of a key, read back from the pool"""
+    t, w = pool.poseidon2.t, pool.w
+    base = key * pool.key_size
+    return [[types.persistence[base + c * w * t + j] for j in range(t)] for c in range(pool.chunks)]
+
+
+@pytest.mark.parametrize('key', [0, 1, 2])
+@pytest.mark.parametrize('digits', [[3, 0, 2], [0, 0, 0], [3, 3, 3]])
+def test_select(pool, key, digits):
+    inst, pool = pool
+    signature = pool.select(key, encoding(3, digits))
+    assert rows(signature) == as_lists(inst.ref.ots(seeds(pool, key), digits))
+
+
+@pytest.mark.parametrize('digits', [[4, 0, 0], [0, 0, 7]])
+def test_select_past_chain_end(pool, digits):
+    inst, pool = pool
+    with pytest.raises(RuntimeError, match='exceeds the chain length'):
+        pool.select(0, encoding(3, digits))
@@ -0,0 +1,49 @@
+import pytest
+
+from Compiler.types import sint
+from conftest import Instance, matrix, rows, vector, as_lists
+
+# Fields with alpha = 3, 5 and 7, at widths with an even and an odd number
+# of partial rounds
+INSTANCES = [
+    ('koalabear', 16),
+    ('koalabear', 8),
+    ('babybear', 8),
+    ('babybear', 16),
+    ('goldilocks', 8),
+    ('bn254', 3),
+    ('bn254', 8),
+]
+
+
+def test_instances_cover_odd_partial_rounds():
+    partial_rounds = [Instance(field, t).poseidon2.Ri % 2 for field, t in INSTANCES]
+    assert 0 in partial_rounds and 1 in partial_rounds
+
+
+@pytest.mark.parametrize('field, t', INSTANCES)
+@pytest.mark.parametrize('pool', [False, True])
+@pytest.mark.parametrize('unroll', [0, 3])
+def test_paired_matches_single_and_reference(instance, field, t, pool, unroll):
+    inputs = instance(field, t).elements(3, t)
+    outputs = {}
+    for partial in ('single', 'paired'):
+        inst = instance(field, t, unroll=unroll, partial=partial)
+        if pool:
+            inst.poseidon2.preprocess_powers(3 * 2)
+        outputs[partial] = rows(inst.poseidon2.hash_chain_batch(matrix(inputs, t), 2))
+        if pool:
+            assert inst.poseidon2.power_tuples.used.read() == inst.poseidon2.power_tuples.size
+            if partial == 'paired':
+                assert inst.poseidon2.pair_tuples.used.read() == inst.poseidon2.pair_tuples.size
+    assert outputs['paired'] == outputs['single']
+    assert outputs['paired'] == as_lists(inst.ref.hash_chain(inputs, 2))
+
+
+@pytest.mark.parametrize('field, t', [('koalabear', 8), ('babybear', 8)])
+def test_paired_permutation(instance, field, t):
+    inst = instance(field, t, partial='paired')
+    state = inst.elements(t)
+    array = sint.Array(t)
+    array.assign(state)
+    assert vector(inst.poseidon2.permutation(array)) == as_lists(inst.ref.permutation(state))[0]
@@ -0,0 +1,156 @@
+import json
+import math
+import sqlite3
+
+from Compiler import library
+from conftest import matrix
+from parse_logs import parse_log, group_runs, aggregate, generate_table, ingest, load_store, \
+    Summary, summarize, welch_test, save_baseline, compare_baseline
+
+LOG = """Running /root/MP-SPDZ/Scripts/../mascot-party.x 0 {name} -pn 12345 -h localhost -N 3 -P 2130706433 -S 31 -v
+Using statistical security parameter 31
+Time = 2.5 seconds 
+Time1 = 2.4 seconds (12.5 MB, 1200 rounds)
+Data sent = 12.5 MB in ~1200 rounds (party 0 only)
+Global data sent = 37.5 MB (all parties)
+Spent {online} seconds (1.5 MB, 300 rounds) on the online phase and 2.0 seconds (11 MB, 900 rounds) on the preprocessing/offline phase.
+Actual preprocessing cost of program:
+  Type int
+       1184        Triples
+       1184        Squares
+Coordination took 0.001 seconds
+Command line: mascot-party.x 0 {name}
+"""
+
+
+def write_log(directory, name, key='abc', run=1, online=0.5):
+    path = directory / f'{name}_mascot_10ms_{key}_run{run}.log'
+    path.write_text(LOG.format(name=name, online=online))
+    return path
+
+
+def test_variants_are_separate_cells(tmp_path):
+    results = []
+    for name, online in [('poseidon2_chains-8', 0.5), ('poseidon2_chains-8-unroll=4-sbox=square_multiply', 3.0)]:
+        results += parse_log(write_log(tmp_path, name, online=online), 'poseidon2_chains')
+    assert [r.variant for r in results] == ['', 'unroll=4-sbox=square_multiply']
+    assert len(group_runs(results)) == 2
+    assert sorted(r.on_time for r in aggregate(results)) == [0.5, 3.0]
+    assert 'unroll=4-sbox=square_multiply' in generate_table(aggregate(results), 'poseidon2_chains')
+
+
+def test_parse_combined_phase_line(tmp_path):
+    results = parse_log(write_log(tmp_path, 'poseidon2_chains-8'), 'poseidon2_chains')
+    assert len(results) == 1
+    r = results[0]
+    assert (r.protocol, r.params, r.d, r.party) == ('MASCOT', (8,), 10, 0)
+    assert (r.on_time, r.on_data, r.com_rounds) == (0.5, 1.5, 300)
+    assert (r.off_time, r.off_data, r.off_rounds) == (2.0, 11.0, 900)
+    assert r.preprocessing == {'Triples': 1184, 'Squares': 1184}
+    assert r.prec == 2368
+    assert r.global_data == 37.5
+
+
+def test_parse_preprocessing_per_run(tmp_path):
+    path = tmp_path / 'leansig-48-10-326_mascot_1ms_abc_run1.log'
+    first = LOG.format(name='leansig-48-10-326', online=0.5)
+    second = first.replace('0.5 seconds', '0.7 seconds').replace('1184        Triples', '1000        Triples')
+    path.write_text(first + second)
+    results = parse_log(path, 'leansig')
+    assert [r.on_time for r in results] == [0.5, 0.7]
+    assert [r.prec for r in results] == [2368, 2184]
+    assert [r.off_time for r in results] == [2.0, 2.0]
+
+
+def test_store_drops_moved_logs(tmp_path):
+    old = write_log(tmp_path, 'poseidon2_chains-8', key='abc', online=0.9)
+    new = write_log(tmp_path, 'poseidon2_chains-8', key='def', online=0.5)
+    db = sqlite3.connect(':memory:')
+    assert ingest(db, [old, new], 'poseidon2_chains') == 2
+    (tmp_path / 'stale').mkdir()
+    old.rename(tmp_path / 'stale' / old.name)
+    assert ingest(db, [new], 'poseidon2_chains') == 0
+    assert [r.on_time for r in load_store(db, 'poseidon2_chains')] == [0.5]
+
+
+def test_profile_per_run(instance, tmp_path):
+    inst = instance('koalabear', 16, profile=True)
+    library.output.clear()
+    inst.poseidon2.hash_chain_batch(matrix(inst.elements(2, 16), 16), 3)
+    inst.poseidon2.print_profile()
+    profile = library.output[:]
+    assert len(profile) == 5
+    calls = {line.split()[2].rstrip(':'): int(line.split()[5]) for line in profile}
+    Re, Ri = inst.poseidon2.Re, inst.poseidon2.Ri
+    assert calls == {'compress_hash': 3, 'nonlinear_e': 3 * Re, 'nonlinear_i': 3 * Ri,
+                     'linear_e': 3 * (Re + 1), 'linear_i': 3 * Ri}
+
+    log = ''
+    for run, time in enumerate([0.25, 0.75]):
+        timers = ''.join(f'Time{timer} = {time * timer} seconds ({timer}.0 MB, {100 * timer} rounds)\n'
+                         for timer in range(1, 7))
+        log += LOG.format(name='poseidon2_chains-3-profile', online=0.5).replace(
+            'Time1 = 2.4 seconds (12.5 MB, 1200 rounds)\n', '\n'.join(profile) + '\n' + timers)
+    path = tmp_path / 'poseidon2_chains-3-profile_mascot_1ms_abc_run1.log'
+    path.write_text(log)
+    results = parse_log(path, 'poseidon2_chains')
+    assert len(results) == 2
+    for r, time in zip(results, [0.25, 0.75]):
+        assert r.variant == 'profile'
+        assert r.phases['total'] == {'time': time, 'data': 1.0, 'rounds': 100}
+        assert r.phases['nonlinear_i']['time'] == time * 5
+        assert r.phases['nonlinear_i']['rounds'] == 500
+        assert r.phases['compress_hash']['calls'] == 3
+
+
+def test_summarize():
+    st = summarize([1.0, 2.0, 3.0, 4.0])
+    assert (st.n, st.median, st.mean) == (4, 2.5, 2.5)
+    assert math.isclose(st.std, math.sqrt(5 / 3))
+    # t quantile of 3 degrees of freedom at 95%
+    assert math.isclose(st.ci, 3.182446 * st.std / 2, rel_tol=1e-5)
+    assert summarize([0.5]) == Summary(1, 0.5, 0.5, 0.0, 0.0)
+
+
+def test_welch_test():
+    assert welch_test([0.5], [0.51]) is None
+    assert welch_test([0.5, 0.52], [0.51]) is None
+    # Zero variance with several samples on both sides is deterministic
+    assert welch_test([3.0, 3.0], [3.0, 3.0, 3.0]) == 1.0
+    assert welch_test([3.0, 3.0], [4.0, 4.0]) == 0.0
+    assert welch_test([1.0, 1.1, 0.9, 1.05], [1.02, 0.98, 1.01, 0.97]) > 0.05
+    assert welch_test([1.0, 1.1, 0.9, 1.05], [2.0, 2.1, 1.9, 2.05]) < 0.001
+
+
+def test_compare_baseline(tmp_path):
+    def runs(onlines, key):
+        results = []
+        for run, online in enumerate(onlines, start=1):
+            results += parse_log(write_log(tmp_path, 'poseidon2_chains-8', key, run, online), 'poseidon2_chains')
+        return results
+
+    baseline = tmp_path / 'baseline.json'
+    save_baseline(runs([0.50], 'a'), 'poseidon2_chains', baseline)
+    report, regressions = compare_baseline(runs([0.51], 'b'), 'poseidon2_chains', baseline, 0.05)
+    assert regressions == 0 and 'insufficient samples' in report
+
+    save_baseline(runs([0.50, 0.52, 0.49, 0.51], 'c'), 'poseidon2_chains', baseline)
+    assert json.loads(baseline.read_text())['poseidon2_chains']['8|MASCOT|10']['on_time'] == [0.5, 0.52, 0.49, 0.51]
+    report, regressions = compare_baseline(runs([0.51, 0.50, 0.52, 0.49], 'd'), 'poseidon2_chains', baseline, 0.05)
+    assert regressions == 0 and 'No significant changes' in report
+    report, regressions = compare_baseline(runs([0.90, 0.92, 0.91, 0.89], 'e'), 'poseidon2_chains', baseline, 0.05)
+    assert regressions == 1 and 'REGRESSION' in report and 'on_time' in report
+
+
+def test_store_keeps_prefixes_apart(tmp_path):
+    prec = write_log(tmp_path, 'leansig_prec-68-4-1')
+    sig = write_log(tmp_path, 'leansig-68-4-114')
+    db = sqlite3.connect(':memory:')
+    # Both logs are offered to both prefixes, as main used to do
+    assert ingest(db, [prec, sig], 'leansig_prec') == 1
+    assert ingest(db, [prec, sig], 'leansig') == 1
+    for _ in range(2):
+        assert ingest(db, [prec, sig], 'leansig_prec') == 0
+        assert ingest(db, [prec, sig], 'leansig') == 0
+        assert [r.params for r in load_store(db, 'leansig_prec')] == [(68, 4, 1)]
+        assert [r.params for r in load_store(db, 'leansig')] == [(68, 4, 114)]
@@ -0,0 +1,21 @@
+import pytest
+
+from Compiler.program import Program
+from poseidon2 import Poseidon2
+from poseidon2_params import FIELDS
+
+
+def test_instance_checks_compiled_prime(instance):
+    instance('koalabear', 16)
+    Program(FIELDS['babybear'])
+    Poseidon2.instances.clear()
+    with pytest.raises(AssertionError, match='-P %d' % FIELDS['koalabear']):
+        Poseidon2.instance('koalabear', 16)
+
+
+def test_instance_needs_compiled_prime(instance):
+    instance('babybear', 8)
+    Program(None)
+    Poseidon2.instances.clear()
+    with pytest.raises(AssertionError, match='-P %d' % FIELDS['babybear']):
+        Poseidon2.from_args(['field=babybear', 't=8'])
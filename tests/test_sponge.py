@@ -0,0 +1,30 @@
+import pytest
+
+from Compiler.types import sint
+from conftest import matrix, rows, vector, as_lists
+
+
+@pytest.mark.parametrize('field, t', [('koalabear', 16), ('babybear', 8)])
+@pytest.mark.parametrize('rate', [None, 3])
+@pytest.mark.parametrize('length', [0, 1, 2, 3, 4, 7, 8, 9, 16, 17])
+def test_sponge_hash_batch(instance, field, t, rate, length):
+    inst = instance(field, t)
+    messages = inst.elements(3, length)
+    digests = inst.poseidon2.sponge_hash_batch(matrix(messages, length), rate=rate)
+    assert rows(digests) == as_lists(inst.ref.sponge_hash(messages, rate=rate))
+
+
+@pytest.mark.parametrize('output_length', [1, 8, 9, 20])
+def test_sponge_squeeze(instance, output_length):
+    inst = instance('koalabear', 16, unroll=2)
+    messages = inst.elements(2, 11)
+    digests = inst.poseidon2.sponge_hash_batch(matrix(messages, 11), output_length)
+    assert rows(digests) == as_lists(inst.ref.sponge_hash(messages, output_length))
+
+
+def test_sponge_hash(instance):
+    inst = instance('koalabear', 16)
+    message = inst.elements(13)
+    array = sint.Array(13)
+    array.assign(message)
+    assert vector(inst.poseidon2.sponge_hash(array)) == as_lists(inst.ref.sponge_hash(message))[0]